@@ -4,6 +4,7 @@ from .models import (
     AstronomyShow,
     PlanetariumDome,
     Reservation,
+    SeatHold,
     ShowSession,
     ShowTheme,
     Ticket,
@@ -15,3 +16,4 @@ admin.site.register(PlanetariumDome)
 admin.site.register(Reservation)
 admin.site.register(ShowSession)
 admin.site.register(Ticket)
+admin.site.register(SeatHold)
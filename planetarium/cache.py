@@ -0,0 +1,349 @@
+"""Response caching that is invalidated by writes instead of waiting out
+the timeout.
+
+Every cached resource has a version number in the cache. Cached responses
+are keyed by the versions of the resources they were built from, and the
+model signals bump those versions, so a write makes exactly the affected
+pages unreachable and they are rebuilt on the next request. Everything is
+kept in the "catalog" cache, which keeps hot entries in each worker.
+
+A replica may still serve the data from before a write after its versions
+were bumped, so what is built from a replica is cached apart from what is
+built from the primary, and only for settings.REPLICA_PIN_SECONDS.
+"""
+import hashlib
+import json
+import math
+import random
+import time
+from functools import wraps
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.manager import BaseManager
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    quote_etag,
+)
+from django.utils.connection import ConnectionProxy
+from rest_framework.response import Response
+from rest_framework.serializers import ListSerializer
+from rest_framework.utils.encoders import JSONEncoder
+
+from planetarium import db_router
+from planetarium_service import settings
+
+VERSION_KEY = "cache_version:{resource}"
+# The versions and the full path are hashed into {page}, as together they
+# easily pass the 250 characters cache backends are guaranteed to accept
+RESPONSE_KEY = "cached_response:{database}:{principal}:{format}:{page}"
+STALE_RESPONSE_KEY = "stale_response:{database}:{principal}:{format}:{page}"
+REBUILD_LOCK_KEY = "rebuilding:{key}"
+
+# How long the last response of a page stays servable after it expired
+# or its resources changed, while one worker is rebuilding it
+STALE_TIMEOUT = 60 * 5
+REBUILD_LOCK_TIMEOUT = 30
+REBUILD_WAIT = 2
+REBUILD_POLL_INTERVAL = 0.05
+# Above 1 favours earlier refreshes, see _refresh_early
+EARLY_REFRESH_BETA = 1.0
+
+# Two-tier cache, see planetarium.cache_backends
+cache = ConnectionProxy(caches, "catalog")
+
+
+def get_versions(resources):
+    """Current version of every resource, fetched with one multi-get"""
+    keys = {
+        VERSION_KEY.format(resource=resource): resource
+        for resource in resources
+    }
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        # A lost version must never bring back pages cached under an older
+        # one, so it restarts from the clock rather than from 1
+        cache.add(key, time.time_ns(), None)
+        versions[key] = cache.get(key)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def _versions_tag(versions, resources):
+    return "+".join(
+        f"{resource}.{versions[resource]}" for resource in sorted(resources)
+    )
+
+
+def bump_version(*resources):
+    for resource in resources:
+        key = VERSION_KEY.format(resource=resource)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def invalidate(*resources):
+    """Bump versions now and once more when the transaction commits, so a
+    page rebuilt from not yet committed data does not survive"""
+    bump_version(*resources)
+    transaction.on_commit(lambda: bump_version(*resources))
+
+
+def _read_scope(timeout):
+    """Database of the current request and the longest time what is read
+    from it may be cached"""
+    if not db_router.reads_from_replica():
+        return "primary", timeout
+    return "replica", min(timeout, settings.REPLICA_PIN_SECONDS)
+
+
+def _principal(request, scope):
+    user = request.user
+    if scope == "public":
+        return "public"
+    if not (user and user.is_authenticated):
+        return "anonymous"
+    if scope == "authenticated":
+        return "authenticated"
+    return f"user.{user.pk}"
+
+
+def _refresh_early(entry):
+    """Decide to rebuild a still valid entry before it expires.
+
+    The probability grows as the expiry gets closer and with the time the
+    last rebuild took, so under load one request rebuilds the page ahead
+    of the expiry instead of all of them at once right after it.
+    """
+    gap = -entry["delta"] * EARLY_REFRESH_BETA * math.log(
+        1 - random.random()
+    )
+    return time.time() + gap >= entry["expires_at"]
+
+
+def _digest(*parts):
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def _etag(data, salt):
+    body = json.dumps(data, sort_keys=True, cls=JSONEncoder)
+    return quote_etag(
+        hashlib.sha256(f"{salt}:{body}".encode()).hexdigest()[:32]
+    )
+
+
+def _cached_response(entry):
+    response = Response(entry["data"])
+    if entry.get("etag"):
+        response["ETag"] = entry["etag"]
+    return response
+
+
+def _build_and_store(key, stale_key, timeout, build, etag_salt):
+    started = time.monotonic()
+    response = build()
+    # A view may cut the timeout short for data that goes stale on its own
+    timeout = min(timeout, getattr(response, "cache_timeout", timeout))
+    if response.status_code == 200:
+        response["ETag"] = _etag(response.data, etag_salt)
+        if timeout > 0:
+            entry = {
+                "data": response.data,
+                "etag": response["ETag"],
+                "delta": time.monotonic() - started,
+                "expires_at": time.time() + timeout,
+            }
+            cache.set(key, entry, timeout)
+            cache.set(stale_key, entry, timeout + STALE_TIMEOUT)
+    return response
+
+
+def _wait_for(key):
+    deadline = time.monotonic() + REBUILD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(REBUILD_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def get_or_build(key, stale_key, timeout, build, etag_salt=""):
+    """Cached response under key, or the response of build() cached there.
+
+    Only the worker holding the rebuild lock runs build(), the others
+    serve the entry being refreshed or the stale response of the page,
+    and wait for the rebuild only when there is neither.
+
+    The ETag of the data, salted with etag_salt, is computed when the
+    entry is built and kept with it.
+    """
+    entry = cache.get(key)
+    if entry is not None and not _refresh_early(entry):
+        return _cached_response(entry)
+
+    lock_key = REBUILD_LOCK_KEY.format(key=key)
+    if not cache.add(lock_key, True, REBUILD_LOCK_TIMEOUT):
+        entry = entry or cache.get(stale_key) or _wait_for(key)
+        if entry is not None:
+            return _cached_response(entry)
+        # The rebuild takes too long, do not keep the request waiting on it
+        return _build_and_store(key, stale_key, timeout, build, etag_salt)
+    try:
+        return _build_and_store(key, stale_key, timeout, build, etag_salt)
+    finally:
+        cache.delete(lock_key)
+
+
+def cache_response(timeout, resources, scope="public"):
+    """Cache a view's response data until the timeout or until any of the
+    resources gets a new version.
+
+    ``scope`` decides who shares a cached response: "public" shares it
+    with everyone, "authenticated" keeps anonymous and authenticated
+    requests apart, and "user" caches per user. Resources may refer to
+    the user as "{user}", e.g. "reservations:{user}".
+
+    Expired and invalidated pages are rebuilt by one request at a time,
+    see get_or_build. A view that knows when its data goes stale sets
+    ``cache_timeout`` on the response to keep it for a shorter time.
+
+    The data is rendered on every request, so content negotiation keeps
+    working. Clients and proxies know nothing about the versions, so they
+    have to revalidate the response on every use, and only responses of
+    the public scope may be kept by shared caches. Revalidation is cheap:
+    the ETag is kept with the entry, and If-None-Match is answered with a
+    304 from it without a query.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            view_resources = [
+                resource.format(user=request.user.pk)
+                for resource in resources
+            ]
+            database, page_timeout = _read_scope(timeout)
+            path = request.get_full_path()
+            page = {
+                "database": database,
+                "principal": _principal(request, scope),
+                "format": request.accepted_renderer.format,
+            }
+            versions = _versions_tag(
+                get_versions(view_resources), view_resources
+            )
+            response = get_or_build(
+                RESPONSE_KEY.format(page=_digest(versions, path), **page),
+                STALE_RESPONSE_KEY.format(page=_digest(path), **page),
+                page_timeout,
+                lambda: view_method(self, request, *args, **kwargs),
+                etag_salt=page["format"],
+            )
+            if response.has_header("ETag"):
+                response = (
+                    get_conditional_response(request, etag=response["ETag"])
+                    or response
+                )
+            if scope == "public":
+                patch_cache_control(response, no_cache=True)
+            else:
+                patch_cache_control(response, no_cache=True, private=True)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _fragment_key(serializer, instance, database, versions):
+    return (
+        f"fragment:{database}:{type(serializer).__name__}:"
+        f"{instance._meta.label_lower}:{instance.pk}:{versions}"
+    )
+
+
+def prefetch_fragments(context, pairs):
+    """Load the cached representations of (serializer, instance) pairs
+    with one multi-get and build the missing ones.
+
+    Fragments are kept in the serializer context, where
+    FragmentCacheMixin.to_representation picks them up.
+    """
+    pairs = [
+        (serializer, instance)
+        for serializer, instance in pairs
+        if instance is not None
+        and instance.pk is not None
+        and not hasattr(serializer.root, "initial_data")
+    ]
+    fragments = context.setdefault("fragments", {})
+    database, timeout = _read_scope(FragmentCacheMixin.fragment_timeout)
+    versions = get_versions({
+        resource
+        for serializer, _ in pairs
+        for resource in serializer.fragment_resources
+    })
+
+    keys = {}
+    for serializer, instance in pairs:
+        key = _fragment_key(
+            serializer,
+            instance,
+            database,
+            _versions_tag(versions, serializer.fragment_resources),
+        )
+        keys[key] = (serializer, instance)
+        serializer._fragment_keys[instance.pk] = key
+
+    fragments.update(cache.get_many(keys.keys() - fragments.keys()))
+    missing = {
+        key: serializer.build_representation(instance)
+        for key, (serializer, instance) in keys.items()
+        if key not in fragments
+    }
+    if missing:
+        cache.set_many(missing, timeout)
+        fragments.update(missing)
+
+
+class FragmentCacheMixin:
+    """Serve the representation of each object from the cache.
+
+    Fragments are keyed by serializer, model, pk and the versions of
+    ``fragment_resources``, which the model signals bump on every write,
+    so a fragment shared by many responses is only built once. Output of
+    serializers that are writing data is never cached.
+    """
+
+    fragment_resources = ()
+    fragment_timeout = 60 * 60 * 24
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._fragment_keys = {}
+
+    def build_representation(self, instance):
+        return super().to_representation(instance)
+
+    def to_representation(self, instance):
+        if instance.pk is None or hasattr(self.root, "initial_data"):
+            return self.build_representation(instance)
+        key = self._fragment_keys.get(instance.pk)
+        if key not in self.context.get("fragments", {}):
+            prefetch_fragments(self.context, [(self, instance)])
+            key = self._fragment_keys[instance.pk]
+        return self.context["fragments"][key]
+
+
+class FragmentListSerializer(ListSerializer):
+    """Prefetch the fragments of all listed objects with one multi-get"""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, BaseManager) else data
+        iterable = list(iterable)
+        prefetch_fragments(
+            self.context, [(self.child, item) for item in iterable]
+        )
+        return super().to_representation(iterable)
@@ -0,0 +1,595 @@
+"""Cache backends wrapping the shared Redis cache.
+
+TwoTierCache keeps a bounded in-process LRU in front of another cache.
+Reads are served from the local tier when possible and fall back to the
+remote cache named by LOCATION, usually the shared Redis cache. Writes go
+to the remote cache and evict the key from the local tier of every
+worker: directly in the writing process and over Redis pub/sub in the
+others. A worker that loses its subscription clears its local tier, and
+local entries never outlive LOCAL_TIMEOUT, so a missed message costs at
+most that much staleness.
+
+    CACHES = {
+        "default": {...},
+        "catalog": {
+            "BACKEND": "planetarium.cache_backends.TwoTierCache",
+            "LOCATION": "default",
+            "OPTIONS": {"MAX_ENTRIES": 1000, "LOCAL_TIMEOUT": 60},
+        },
+    }
+
+ResilientRedisCache is the Redis cache with short socket timeouts and a
+circuit breaker, which switches to a local in-memory cache while Redis is
+failing instead of making every request wait for its timeouts.
+"""
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+CLEAR_MESSAGE = "*"
+RESUBSCRIBE_DELAY = 1
+LISTEN_TIMEOUT = 1
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """Thread-safe LRU of at most max_entries values with per-entry expiry"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            if timeout <= 0:
+                self._entries.pop(key, None)
+                return
+            self._entries[key] = (value, time.monotonic() + timeout)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _Tier:
+    """Local tier shared by all threads of one process"""
+
+    def __init__(self, max_entries):
+        self.local = LocalLRU(max_entries)
+        self.remote_hits = 0
+        self.remote_misses = 0
+        # Tells the own messages apart on the shared channel
+        self.origin = uuid.uuid4().hex
+        # Bumped by every eviction, a read that raced with one does not
+        # store the value it fetched
+        self.generation = 0
+        self.listener = None
+
+    def evict(self, keys):
+        self.generation += 1
+        for key in keys:
+            if key == CLEAR_MESSAGE:
+                self.local.clear()
+            else:
+                self.local.delete(key)
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+def _get_tier(channel, max_entries):
+    # Keyed by pid as well, a forked worker must not share the parent's
+    # tier nor rely on its listener thread
+    tier_key = (os.getpid(), channel)
+    with _tiers_lock:
+        if tier_key not in _tiers:
+            _tiers[tier_key] = _Tier(max_entries)
+        return _tiers[tier_key]
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._remote_alias = location
+        self._local_timeout = options.get("LOCAL_TIMEOUT", 60)
+        self._channel = options.get(
+            "CHANNEL", f"cache_invalidation:{location}"
+        )
+        self._tier = _get_tier(self._channel, self._max_entries)
+
+    @property
+    def _remote(self):
+        return caches[self._remote_alias]
+
+    def _local_key(self, key, version):
+        return self._remote.make_and_validate_key(key, version=version)
+
+    def _redis_client(self):
+        remote = self._remote
+        # Nothing to publish to while a resilient remote is on its fallback
+        if isinstance(remote, RedisCache) and getattr(
+            remote, "available", True
+        ):
+            return remote._cache.get_client(write=True)
+        return None
+
+    def _ensure_listener(self):
+        tier = self._tier
+        if tier.listener is not None:
+            return
+        with _tiers_lock:
+            if tier.listener is not None or self._redis_client() is None:
+                return
+            tier.listener = threading.Thread(
+                target=self._listen,
+                name=f"cache-invalidation-{self._remote_alias}",
+                daemon=True,
+            )
+            tier.listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                client = self._redis_client()
+                if client is not None:
+                    self._receive(client)
+            except Exception:
+                logger.warning(
+                    "Lost cache invalidation channel %s",
+                    self._channel,
+                    exc_info=True,
+                )
+            # Messages may have been missed while unsubscribed
+            self._tier.local.clear()
+            time.sleep(RESUBSCRIBE_DELAY)
+
+    def _receive(self, client):
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self._channel)
+        while True:
+            # Polled rather than blocking on listen(), which would trip
+            # the short socket timeout of an idle connection
+            message = pubsub.get_message(timeout=LISTEN_TIMEOUT)
+            if message is None:
+                continue
+            origin, _, key = message["data"].decode().partition(" ")
+            if origin != self._tier.origin:
+                self._tier.evict([key])
+
+    def _invalidate(self, local_keys):
+        self._tier.evict(local_keys)
+        client = self._redis_client()
+        if client is None:
+            return
+        try:
+            pipeline = client.pipeline(transaction=False)
+            origin = self._tier.origin
+            for key in local_keys:
+                pipeline.publish(self._channel, f"{origin} {key}")
+            pipeline.execute()
+        except Exception:
+            logger.warning(
+                "Failed to publish cache invalidation of %s",
+                local_keys,
+                exc_info=True,
+            )
+
+    def _local_set(self, local_key, value, timeout, generation):
+        if generation != self._tier.generation:
+            return
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            timeout = self._local_timeout
+        self._tier.local.set(
+            local_key,
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+            min(timeout, self._local_timeout),
+        )
+
+    def stats(self):
+        """Hits and misses of both tiers in this process"""
+        tier = self._tier
+        return {
+            "local.hits": tier.local.hits,
+            "local.misses": tier.local.misses,
+            "local.entries": len(tier.local),
+            "remote.hits": tier.remote_hits,
+            "remote.misses": tier.remote_misses,
+        }
+
+    def get(self, key, default=None, version=None):
+        self._ensure_listener()
+        local_key = self._local_key(key, version)
+        value = self._tier.local.get(local_key)
+        if value is not _MISSING:
+            return pickle.loads(value)
+
+        generation = self._tier.generation
+        value = self._remote.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._tier.remote_misses += 1
+            return default
+        self._tier.remote_hits += 1
+        self._local_set(local_key, value, DEFAULT_TIMEOUT, generation)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._ensure_listener()
+        found = {}
+        missing = {}
+        for key in keys:
+            local_key = self._local_key(key, version)
+            value = self._tier.local.get(local_key)
+            if value is _MISSING:
+                missing[key] = local_key
+            else:
+                found[key] = pickle.loads(value)
+        if not missing:
+            return found
+
+        generation = self._tier.generation
+        fetched = self._remote.get_many(missing, version=version)
+        self._tier.remote_hits += len(fetched)
+        self._tier.remote_misses += len(missing) - len(fetched)
+        for key, value in fetched.items():
+            self._local_set(missing[key], value, DEFAULT_TIMEOUT, generation)
+        found.update(fetched)
+        return found
+
+    def has_key(self, key, version=None):
+        local_key = self._local_key(key, version)
+        if self._tier.local.get(local_key) is not _MISSING:
+            return True
+        return self._remote.has_key(key, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self._local_key(key, version)
+        self._remote.set(key, value, timeout, version=version)
+        self._invalidate([local_key])
+        self._local_set(local_key, value, timeout, self._tier.generation)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self._remote.set_many(data, timeout, version=version)
+        local_keys = {key: self._local_key(key, version) for key in data}
+        self._invalidate(list(local_keys.values()))
+        generation = self._tier.generation
+        for key, value in data.items():
+            if key not in failed:
+                self._local_set(local_keys[key], value, timeout, generation)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._remote.add(key, value, timeout, version=version)
+        if added:
+            self._invalidate([self._local_key(key, version)])
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._remote.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self._remote.incr(key, delta, version=version)
+        self._invalidate([self._local_key(key, version)])
+        return value
+
+    def delete(self, key, version=None):
+        deleted = self._remote.delete(key, version=version)
+        self._invalidate([self._local_key(key, version)])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        self._remote.delete_many(keys, version=version)
+        self._invalidate([self._local_key(key, version) for key in keys])
+
+    def clear(self):
+        self._remote.clear()
+        self._invalidate([CLEAR_MESSAGE])
+
+
+class CircuitOpenError(RedisConnectionError):
+    """Raised instead of calling Redis while the breaker is open"""
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures and lets a single
+    trial call through once reset_timeout has passed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (
+                self.state == self.OPEN
+                and time.monotonic() - self.opened_at >= self.reset_timeout
+            ):
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        """Close the breaker, returns whether it was not closed"""
+        with self._lock:
+            recovered = self.state != self.CLOSED
+            self.state = self.CLOSED
+            self.failures = 0
+            return recovered
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if (
+                self.state == self.HALF_OPEN
+                or self.failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class _Fallback:
+    """Breaker and fallback cache shared by all threads of one process"""
+
+    def __init__(self, breaker, cache, max_written, timeout):
+        self.breaker = breaker
+        self.cache = cache
+        self.max_written = max_written
+        # Entries of one worker miss the writes of the others, version
+        # bumps included, so they are kept only this long
+        self.timeout = timeout
+        # Keys written while Redis was unreachable, deleted from Redis on
+        # recovery since it missed those writes
+        self.written = set()
+        self.written_overflow = False
+        self.lock = threading.Lock()
+
+    def record_writes(self, keys):
+        with self.lock:
+            for key in keys:
+                if len(self.written) >= self.max_written:
+                    self.written_overflow = True
+                    return
+                self.written.add(key)
+
+    def take_writes(self):
+        with self.lock:
+            written, overflow = self.written, self.written_overflow
+            self.written, self.written_overflow = set(), False
+            return written, overflow
+
+
+_fallbacks = {}
+
+
+def _get_fallback(server, params, options):
+    fallback_key = (os.getpid(), str(server))
+    with _tiers_lock:
+        if fallback_key not in _fallbacks:
+            _fallbacks[fallback_key] = _Fallback(
+                CircuitBreaker(
+                    options.get("FAILURE_THRESHOLD", 3),
+                    options.get("RESET_TIMEOUT", 10),
+                ),
+                LocMemCache(
+                    f"fallback:{server}",
+                    {
+                        **params,
+                        "OPTIONS": {
+                            "MAX_ENTRIES": options.get(
+                                "FALLBACK_MAX_ENTRIES", 1000
+                            )
+                        },
+                    },
+                ),
+                options.get("FALLBACK_MAX_WRITTEN", 10000),
+                options.get(
+                    "FALLBACK_TIMEOUT", options.get("RESET_TIMEOUT", 10)
+                ),
+            )
+        return _fallbacks[fallback_key]
+
+
+class ResilientRedisCache(RedisCache):
+    """Redis cache that degrades to a per-process in-memory cache.
+
+    Calls fail fast on the short socket timeouts, and after
+    FAILURE_THRESHOLD failures in a row the breaker sends every call to
+    the fallback cache for RESET_TIMEOUT seconds before trying Redis
+    again. Keys written to the fallback are deleted from Redis when it
+    is back, so version counters restart instead of going backwards.
+    Fallback entries expire after FALLBACK_TIMEOUT seconds, RESET_TIMEOUT
+    by default, whatever timeout they were written with.
+    """
+
+    BREAKER_OPTIONS = (
+        "FAILURE_THRESHOLD",
+        "RESET_TIMEOUT",
+        "FALLBACK_MAX_ENTRIES",
+        "FALLBACK_MAX_WRITTEN",
+        "FALLBACK_TIMEOUT",
+    )
+
+    def __init__(self, server, params):
+        options = dict(params.get("OPTIONS", {}))
+        breaker_options = {
+            name: options.pop(name)
+            for name in self.BREAKER_OPTIONS
+            if name in options
+        }
+        options.setdefault("socket_connect_timeout", 0.1)
+        options.setdefault("socket_timeout", 0.25)
+        super().__init__(server, {**params, "OPTIONS": options})
+        self._fallback = _get_fallback(server, params, breaker_options)
+
+    @property
+    def available(self):
+        return self._fallback.breaker.state == CircuitBreaker.CLOSED
+
+    def stats(self):
+        breaker = self._fallback.breaker
+        return {
+            "breaker.state": breaker.state,
+            "breaker.failures": breaker.failures,
+            "fallback.written": len(self._fallback.written),
+        }
+
+    def get_client(self, key=None, write=False):
+        """Raw Redis client, for commands the cache API does not have"""
+        if not self.available:
+            raise CircuitOpenError("Redis circuit breaker is open")
+        return self._cache.get_client(key, write=write)
+
+    def _call(
+        self, name, args, written_keys=(), version=None, fallback_args=None
+    ):
+        fallback = self._fallback
+        if fallback.breaker.allow():
+            try:
+                result = getattr(RedisCache, name)(self, *args)
+            except RedisError:
+                logger.warning(
+                    "Redis cache call %s failed", name, exc_info=True
+                )
+                fallback.breaker.record_failure()
+            except Exception:
+                # Redis answered, the error is the caller's business
+                self._record_success()
+                raise
+            else:
+                self._record_success()
+                return result
+
+        fallback.record_writes((key, version) for key in written_keys)
+        return getattr(fallback.cache, name)(*(fallback_args or args))
+
+    def _fallback_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self._fallback.timeout
+        return min(timeout, self._fallback.timeout)
+
+    def _record_success(self):
+        if not self._fallback.breaker.record_success():
+            return
+        written, overflow = self._fallback.take_writes()
+        if overflow:
+            logger.warning(
+                "More keys were written while Redis was unavailable than "
+                "could be tracked, some cached data may be stale"
+            )
+        versions = {}
+        for key, version in written:
+            versions.setdefault(version, []).append(key)
+        try:
+            for version, keys in versions.items():
+                RedisCache.delete_many(self, keys, version)
+        except RedisError:
+            logger.warning("Failed to delete keys written during the outage")
+        self._fallback.cache.clear()
+
+    def get(self, key, default=None, version=None):
+        return self._call("get", (key, default, version))
+
+    def get_many(self, keys, version=None):
+        return self._call("get_many", (keys, version))
+
+    def has_key(self, key, version=None):
+        return self._call("has_key", (key, version))
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call(
+            "set",
+            (key, value, timeout, version),
+            [key],
+            version,
+            (key, value, self._fallback_timeout(timeout), version),
+        )
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call(
+            "set_many",
+            (data, timeout, version),
+            list(data),
+            version,
+            (data, self._fallback_timeout(timeout), version),
+        )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call(
+            "add",
+            (key, value, timeout, version),
+            [key],
+            version,
+            (key, value, self._fallback_timeout(timeout), version),
+        )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._call(
+            "touch",
+            (key, timeout, version),
+            fallback_args=(key, self._fallback_timeout(timeout), version),
+        )
+
+    def incr(self, key, delta=1, version=None):
+        return self._call("incr", (key, delta, version), [key], version)
+
+    def delete(self, key, version=None):
+        return self._call("delete", (key, version), [key], version)
+
+    def delete_many(self, keys, version=None):
+        return self._call("delete_many", (keys, version), list(keys), version)
+
+    def clear(self):
+        return self._call("clear", ())
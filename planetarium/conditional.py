@@ -0,0 +1,80 @@
+"""Conditional GET for list and detail endpoints.
+
+The ETag and Last-Modified of a response come from one aggregate query,
+the number of rows and the latest updated_at of the rows and of the
+related rows the response shows. A client that sends them back in
+If-None-Match or If-Modified-Since gets a 304 without the payload being
+serialized.
+
+Lists get no Last-Modified: deleting a row does not move the latest
+updated_at, so only the ETag, which counts the rows, can tell. Cached
+lists get their ETag from planetarium.cache instead.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+def modification_state(queryset, fields):
+    """Row count and the latest of the given timestamp fields"""
+    aggregates = {
+        f"updated_{index}": Max(field) for index, field in enumerate(fields)
+    }
+    state = queryset.order_by().aggregate(count=Count("pk"), **aggregates)
+    timestamps = [
+        state[name] for name in aggregates if state[name] is not None
+    ]
+    return state["count"], max(timestamps, default=None)
+
+
+def conditional_response(fields=("updated_at",)):
+    """Answer list and detail requests with 304 when the client already has
+    the current response.
+
+    ``fields`` are the timestamps the response depends on, e.g.
+    "show_theme__updated_at" for a show listing the name of its theme.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            queryset = self.filter_queryset(self.get_queryset())
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            is_detail = lookup_url_kwarg in kwargs
+            if is_detail:
+                queryset = queryset.filter(
+                    **{self.lookup_field: kwargs[lookup_url_kwarg]}
+                )
+            count, updated_at = modification_state(queryset, fields)
+
+            tag = ":".join(
+                [
+                    request.get_full_path(),
+                    request.accepted_renderer.format,
+                    str(count),
+                    updated_at.isoformat() if updated_at else "",
+                ]
+            )
+            etag = quote_etag(hashlib.sha256(tag.encode()).hexdigest()[:32])
+            last_modified = (
+                int(updated_at.timestamp())
+                if is_detail and updated_at
+                else None
+            )
+
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = view_method(self, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response["ETag"] = etag
+                if last_modified is not None:
+                    response["Last-Modified"] = http_date(last_modified)
+            return response
+
+        return wrapper
+
+    return decorator
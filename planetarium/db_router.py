@@ -0,0 +1,148 @@
+"""Reads of the API from the database replicas.
+
+Safe requests to the views of ReplicaReadMixin read from one of the
+settings.DATABASE_REPLICAS aliases, picked at random on the first query
+of the request, so requests answered from the caches never connect to a
+replica. Everything else, writes, admin and management commands, uses the
+primary.
+
+Replicas lag behind the primary, so a user who has just written is pinned
+to the primary for settings.REPLICA_PIN_SECONDS and sees their own
+booking right away. A replica that cannot be connected to is skipped by
+its circuit breaker, and reads fall back to the primary when no replica
+is left.
+"""
+import logging
+import random
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from planetarium.cache_backends import CircuitBreaker
+from planetarium_service import settings
+
+logger = logging.getLogger(__name__)
+
+PIN_KEY = "primary_pin:{user_id}"
+
+REPLICA_FAILURE_THRESHOLD = 1
+REPLICA_RESET_TIMEOUT = 30
+
+_read_alias = ContextVar("read_alias", default=None)
+_breakers = {}
+
+
+def _breaker(alias):
+    if alias not in _breakers:
+        _breakers[alias] = CircuitBreaker(
+            REPLICA_FAILURE_THRESHOLD, REPLICA_RESET_TIMEOUT
+        )
+    return _breakers[alias]
+
+
+def pin_to_primary(user_id):
+    cache.set(
+        PIN_KEY.format(user_id=user_id), True, settings.REPLICA_PIN_SECONDS
+    )
+
+
+def is_pinned(user_id):
+    return cache.get(PIN_KEY.format(user_id=user_id)) is not None
+
+
+class ReplicaRead:
+    """The replica of a request, chosen when it is first needed"""
+
+    def __init__(self):
+        self.chosen = False
+        self.alias = None
+
+    def resolve(self):
+        if not self.chosen:
+            self.alias = choose_replica()
+            self.chosen = True
+        return self.alias
+
+
+def reads_from_replica():
+    """Whether the current request may read from a replica, without
+    connecting to one"""
+    return _read_alias.get() is not None
+
+
+def choose_replica():
+    """A reachable replica, or None to read from the primary"""
+    replicas = list(settings.DATABASE_REPLICAS)
+    random.shuffle(replicas)
+    for alias in replicas:
+        breaker = _breaker(alias)
+        if not breaker.allow():
+            continue
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError as error:
+            logger.warning("Replica %s is unreachable: %s", alias, error)
+            breaker.record_failure()
+            continue
+        breaker.record_success()
+        return alias
+    return None
+
+
+class ReplicaRouter:
+    """Sends reads to the replica chosen for the current request"""
+
+    def db_for_read(self, model, **hints):
+        replica_read = _read_alias.get()
+        if replica_read is None:
+            return None
+        return replica_read.resolve()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """Read safe requests of the view from a replica unless the user has
+    written a moment ago, and pin users to the primary when they write"""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            not settings.DATABASE_REPLICAS
+            or request.method not in SAFE_METHODS
+        ):
+            return
+        user = request.user
+        if user and user.is_authenticated and is_pinned(user.pk):
+            return
+        self._read_alias_token = _read_alias.set(ReplicaRead())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, "_read_alias_token", None)
+        if token is not None:
+            _read_alias.reset(token)
+            self._read_alias_token = None
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+        ):
+            user = request.user
+            if user and user.is_authenticated:
+                pin_to_primary(user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,24 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class SeatsConflict(APIException):
+    """Requested seats are sold or held, with free seats to offer instead"""
+
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Some of the requested seats are already taken."
+    default_code = "seats_conflict"
+
+    def __init__(self, conflicts, suggestions=()):
+        super().__init__()
+        # Kept as a plain dict, so seat numbers are not turned into strings
+        self.detail = {
+            "detail": self.default_detail,
+            "code": self.default_code,
+            "conflicts": [
+                {"row": row, "seat": seat} for row, seat in conflicts
+            ],
+            "suggestions": [
+                {"row": row, "seat": seat} for row, seat in suggestions
+            ],
+        }
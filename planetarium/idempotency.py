@@ -0,0 +1,122 @@
+"""Idempotency-Key support for endpoints that create bookings.
+
+The first response to a key is stored in the cache and replayed for every
+retry with the same key, without running the view again. A retry that
+arrives while the first request is still running waits for its response
+on a short lock instead of racing it to the database.
+"""
+import hashlib
+import json
+import secrets
+import time
+from functools import wraps
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.redis import RedisCache
+from redis.exceptions import RedisError
+from rest_framework import status
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TIMEOUT = 60 * 60 * 24
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+IDEMPOTENCY_WAIT = 5
+IDEMPOTENCY_POLL_INTERVAL = 0.05
+
+# Deletes the lock only while it still holds the token of its owner
+RELEASE_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    if stored["fingerprint"] != fingerprint:
+        return Response(
+            {"detail": f"{IDEMPOTENCY_HEADER} was already used "
+                       f"with a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = Response(stored["data"], status=stored["status"])
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _release_lock(lock_key, token):
+    """Delete the lock unless it expired and another request holds it"""
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(backend, RedisCache):
+        key = backend.make_key(lock_key)
+        get_client = getattr(backend, "get_client", backend._cache.get_client)
+        try:
+            # Integers are stored unpickled, so the script sees the token
+            get_client(key, write=True).eval(
+                RELEASE_LOCK_SCRIPT, 1, key, token
+            )
+            return
+        except RedisError:
+            pass
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def idempotent(view_method):
+    """Answer repeated requests with the same Idempotency-Key from cache"""
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        cache_key = f"idempotency:{request.user.pk}:{request.path}:{digest}"
+        lock_key = f"{cache_key}:lock"
+        fingerprint = _fingerprint(request)
+
+        stored = cache.get(cache_key)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+        token = secrets.randbits(62)
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT
+        while not cache.add(lock_key, token, IDEMPOTENCY_LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                return Response(
+                    {"detail": "A request with this "
+                               f"{IDEMPOTENCY_HEADER} is still in progress."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+
+        try:
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return _replay(stored, fingerprint)
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code < 500:
+                cache.set(
+                    cache_key,
+                    {
+                        "fingerprint": fingerprint,
+                        "status": response.status_code,
+                        "data": response.data,
+                    },
+                    IDEMPOTENCY_TIMEOUT,
+                )
+            return response
+        finally:
+            _release_lock(lock_key, token)
+
+    return wrapper
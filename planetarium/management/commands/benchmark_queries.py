@@ -0,0 +1,233 @@
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from planetarium.models import (
+    AstronomyShow,
+    PlanetariumDome,
+    Reservation,
+    SeatHold,
+    ShowSession,
+    Ticket,
+)
+from planetarium.views import ShowSessionsViewSet
+
+BATCH_SIZE = 2000
+
+
+def benchmark_queries(user, planetarium_dome, using=DEFAULT_DB_ALIAS):
+    """The queries of the hot endpoints, by name"""
+    now = timezone.now()
+    sessions = ShowSessionsViewSet.queryset.using(using)
+    middle = sessions.order_by("-show_time", "-id")[
+        sessions.count() // 2
+    ]
+    return {
+        "nearest_show": sessions.filter(show_time__gte=now).order_by(
+            "show_time"
+        )[:1],
+        "show_sessions_first_page": sessions.order_by("-show_time", "-id")[
+            :5
+        ],
+        "show_sessions_deep_page": sessions.filter(
+            Q(show_time__lt=middle.show_time)
+            | Q(show_time=middle.show_time, id__lt=middle.id)
+        ).order_by("-show_time", "-id")[:5],
+        "dome_schedule": ShowSession.objects.using(using).filter(
+            planetarium_dome=planetarium_dome, show_time__gte=now
+        ).order_by("show_time")[:20],
+        "user_reservations": Reservation.objects.using(using)
+        .filter(user=user)
+        .order_by("-created_at", "-id")[:5],
+        "user_tickets": Ticket.objects.using(using).filter(
+            reservation__user=user
+        ).order_by("row", "seat", "id")[:5],
+        "active_holds": SeatHold.objects.using(using).filter(
+            show_session=middle, expires_at__gt=now
+        ),
+    }
+
+
+def benchmark_indexes():
+    """The indexes added for the queries above"""
+    return [
+        (model, index)
+        for model in (Reservation, SeatHold, ShowSession, Ticket)
+        for index in model._meta.indexes
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a large dataset and report query plans and timings "
+        "with and without the query indexes. Run it against a scratch "
+        "database: the indexes are dropped in one long transaction, which "
+        "locks the tables until the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Alias of the scratch database to seed",
+        )
+        parser.add_argument(
+            "--i-know-this-locks-tables",
+            action="store_true",
+            help="Allow running against the default database",
+        )
+        parser.add_argument("--sessions", type=int, default=20000)
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument(
+            "--tickets-per-session",
+            type=int,
+            default=10,
+            help="Tickets booked in every session",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Runs of every query, the median time is reported",
+        )
+
+    def handle(self, *args, **options):
+        self.using = options["database"]
+        if (
+            self.using == DEFAULT_DB_ALIAS
+            and not options["i_know_this_locks_tables"]
+        ):
+            raise CommandError(
+                "The benchmark locks the tables it drops indexes of until "
+                "it ends. Pass --database with a scratch database, or "
+                "--i-know-this-locks-tables to run it on the default one."
+            )
+        self.connection = connections[self.using]
+
+        # Everything, the seeded data and the dropped indexes, is rolled
+        # back at the end
+        with transaction.atomic(using=self.using):
+            user, planetarium_dome = self.seed(options)
+            timings = {}
+            for label in ("with indexes", "without indexes"):
+                if label == "without indexes":
+                    self.drop_indexes()
+                self.stdout.write(self.style.MIGRATE_HEADING(label))
+                queries = benchmark_queries(
+                    user, planetarium_dome, using=self.using
+                )
+                for name, queryset in queries.items():
+                    timings[label, name] = self.measure(
+                        name, queryset, options["repeat"], label
+                    )
+
+            self.stdout.write(self.style.MIGRATE_HEADING("Summary"))
+            for name in queries:
+                self.stdout.write(
+                    f"{name:<26} "
+                    f"{timings['with indexes', name]:>9.2f} ms with indexes "
+                    f"{timings['without indexes', name]:>9.2f} ms without"
+                )
+            transaction.set_rollback(True, using=self.using)
+
+    def seed(self, options):
+        token = uuid.uuid4().hex[:8]
+        started = time.monotonic()
+        users = get_user_model().objects.using(self.using).bulk_create(
+            get_user_model()(email=f"benchmark-{token}-{number}@example.com")
+            for number in range(options["users"])
+        )
+        astronomy_shows = AstronomyShow.objects.using(self.using).bulk_create(
+            AstronomyShow(title=f"Benchmark {token} {number}")
+            for number in range(50)
+        )
+        domes = PlanetariumDome.objects.using(self.using).bulk_create(
+            PlanetariumDome(
+                name=f"Benchmark {token} {number}", rows=20, seats_in_row=30
+            )
+            for number in range(10)
+        )
+
+        now = timezone.now()
+        sessions = ShowSession.objects.using(self.using).bulk_create(
+            (
+                ShowSession(
+                    astronomy_show=random.choice(astronomy_shows),
+                    planetarium_dome=random.choice(domes),
+                    show_time=now
+                    + timedelta(minutes=random.randint(-525600, 525600)),
+                )
+                for _ in range(options["sessions"])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        reservations = Reservation.objects.using(self.using).bulk_create(
+            (Reservation(user=random.choice(users)) for _ in sessions),
+            batch_size=BATCH_SIZE,
+        )
+        Ticket.objects.using(self.using).bulk_create(
+            (
+                Ticket(
+                    row=number // 30 + 1,
+                    seat=number % 30 + 1,
+                    show_session=show_session,
+                    reservation=reservation,
+                )
+                for show_session, reservation in zip(sessions, reservations)
+                for number in range(options["tickets_per_session"])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        self.analyze()
+        self.stdout.write(
+            f"Seeded {len(sessions)} sessions and {len(users)} users "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+        return users[0], domes[0]
+
+    def drop_indexes(self):
+        schema_editor = self.connection.schema_editor()
+        with self.connection.cursor() as cursor:
+            for model, index in benchmark_indexes():
+                cursor.execute(str(index.remove_sql(model, schema_editor)))
+        self.analyze()
+
+    def analyze(self):
+        # Fresh planner statistics, or the plans reflect the empty tables
+        if self.connection.vendor == "postgresql":
+            with self.connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+    def measure(self, name, queryset, repeat, label):
+        if self.connection.vendor == "postgresql":
+            plan = queryset.explain(analyze=True, buffers=True)
+        elif self.connection.vendor == "sqlite":
+            # SQLite keeps answering a cached EXPLAIN statement with the
+            # plan from before the indexes were dropped, the comment makes
+            # it a new statement
+            sql, params = queryset.query.sql_with_params()
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql} -- {label}", params)
+                plan = "\n".join(
+                    " ".join(map(str, row)) for row in cursor.fetchall()
+                )
+        else:
+            plan = queryset.explain()
+        durations = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset)
+            durations.append((time.perf_counter() - started) * 1000)
+        median = statistics.median(durations)
+
+        self.stdout.write(self.style.SUCCESS(f"{name}: {median:.2f} ms"))
+        self.stdout.write(plan)
+        return median
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from planetarium.models import ShowSession
+from planetarium.services.seat_claims import reconcile_seat_claims
+
+
+class Command(BaseCommand):
+    help = "Rebuild seat claim bitmaps of upcoming sessions from tickets"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "show_sessions",
+            nargs="*",
+            type=int,
+            help="Ids of the sessions to rebuild, all upcoming by default",
+        )
+
+    def handle(self, *args, **options):
+        show_sessions = ShowSession.objects.select_related("planetarium_dome")
+        if options["show_sessions"]:
+            show_sessions = show_sessions.filter(
+                id__in=options["show_sessions"]
+            )
+        else:
+            show_sessions = show_sessions.filter(
+                show_time__gte=timezone.now()
+            )
+
+        count = 0
+        for show_session in show_sessions.iterator():
+            reconcile_seat_claims(show_session)
+            count += 1
+        self.stdout.write(
+            self.style.SUCCESS(f"Reconciled seat claims of {count} sessions")
+        )
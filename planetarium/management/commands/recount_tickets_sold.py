@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from planetarium.models import ShowSession, Ticket
+
+
+def counted_tickets():
+    return Coalesce(
+        Subquery(
+            Ticket.objects.filter(show_session=OuterRef("pk"))
+            .values("show_session")
+            .annotate(count=Count("id"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = "Recompute ShowSession.tickets_sold counters from tickets"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report sessions with wrong counters and fail if any",
+        )
+
+    def handle(self, *args, **options):
+        sessions = ShowSession.objects.annotate(
+            counted=counted_tickets()
+        ).exclude(tickets_sold=F("counted"))
+
+        drifted = list(sessions.values_list("id", "tickets_sold", "counted"))
+        for show_session_id, tickets_sold, counted in drifted:
+            self.stdout.write(
+                f"ShowSession {show_session_id}: "
+                f"tickets_sold={tickets_sold}, tickets={counted}"
+            )
+
+        if options["check"]:
+            if drifted:
+                raise CommandError(
+                    f"{len(drifted)} sessions have wrong tickets_sold"
+                )
+            self.stdout.write(self.style.SUCCESS("All counters are correct"))
+            return
+
+        ShowSession.objects.filter(
+            id__in=[show_session_id for show_session_id, _, _ in drifted]
+        ).update(tickets_sold=counted_tickets())
+        self.stdout.write(
+            self.style.SUCCESS(f"Fixed counters of {len(drifted)} sessions")
+        )
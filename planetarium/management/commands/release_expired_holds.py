@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from planetarium.services.booking import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Release seats of expired holds"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            type=float,
+            metavar="SECONDS",
+            help="Keep sweeping with the given pause between runs",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            count = release_expired_holds()
+            if count:
+                self.stdout.write(f"Released {count} expired seat holds")
+            if not options["loop"]:
+                break
+            time.sleep(options["loop"])
+        self.stdout.write(self.style.SUCCESS("Expired seat holds released"))
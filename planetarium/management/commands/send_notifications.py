@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from planetarium.services.notifications import send_pending_notifications
+from planetarium.services.telegram_bot import TelegramTransport
+
+
+class Command(BaseCommand):
+    help = "Deliver pending notifications from the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            type=float,
+            metavar="SECONDS",
+            help="Keep draining the outbox with the given pause between runs",
+        )
+        parser.add_argument("--batch-size", type=int)
+        parser.add_argument(
+            "--mode",
+            choices=["single", "digest"],
+            help="Notification mode, NOTIFICATIONS['MODE'] by default",
+        )
+
+    def handle(self, *args, **options):
+        transport = TelegramTransport()
+        while True:
+            sent = send_pending_notifications(
+                transport,
+                batch_size=options["batch_size"],
+                mode=options["mode"],
+            )
+            if sent:
+                self.stdout.write(f"Sent {sent} notifications")
+            if not options["loop"]:
+                break
+            if not sent:
+                time.sleep(options["loop"])
+        self.stdout.write(self.style.SUCCESS("Outbox drained"))
@@ -0,0 +1,56 @@
+"""Process-independent counters kept in the default cache.
+
+Counters are plain cache integers, so every worker adds to the same value
+and the metrics endpoint can read them all with one get_many.
+"""
+import logging
+
+from django.core.cache import cache, caches
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = "metrics:{name}"
+
+COUNTERS = (
+    # Bookings turned away by the seat claims before the database
+    "booking.claim_conflicts",
+    # Bookings that lost the race on the unique constraint
+    "booking.integrity_conflicts",
+    # Claims left by dead bookings or expired holds, dropped by a booking
+    "booking.stale_claims",
+    # Bookings of seats held by another user, turned away by the database
+    "booking.hold_conflicts",
+    # Serialization failures and deadlocks retried by booking
+    "booking.serialization_retries",
+    # Booking transactions and the time spent in them, including lock waits
+    "booking.transactions",
+    "booking.transaction_ms",
+)
+
+
+def increment(name, value=1):
+    key = METRICS_KEY.format(name=name)
+    try:
+        if not cache.add(key, value, None):
+            cache.incr(key, value)
+    except Exception:
+        # Metrics must never fail the request that reports them
+        logger.warning("Failed to update metric %s", name, exc_info=True)
+
+
+def get_metrics():
+    keys = {METRICS_KEY.format(name=name): name for name in COUNTERS}
+    values = cache.get_many(keys)
+    return {name: values.get(key, 0) for key, name in keys.items()}
+
+
+def cache_stats():
+    """Per-tier hits and misses of the caches that count them, for the
+    worker answering the request"""
+    stats = {}
+    for alias in caches:
+        backend = caches[alias]
+        if hasattr(backend, "stats"):
+            for name, value in backend.stats().items():
+                stats[f"cache.{alias}.{name}"] = value
+    return stats
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("planetarium", "0006_notification"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="show_session",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="planetarium.showsession",
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="tickets",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
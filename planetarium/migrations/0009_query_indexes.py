@@ -0,0 +1,49 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("planetarium", "0008_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(
+                fields=["user", "created_at", "id"],
+                name="planetarium_user_id_6ada56_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="seathold",
+            index=models.Index(
+                fields=["show_session", "expires_at"],
+                name="planetarium_show_se_6121f5_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="showsession",
+            index=models.Index(
+                fields=["show_time", "id"], name="planetarium_show_ti_f16619_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="showsession",
+            index=models.Index(
+                fields=["planetarium_dome", "show_time"],
+                name="planetarium_planeta_8d0702_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(
+                fields=["reservation", "row", "seat"],
+                name="planetarium_reserva_726bb9_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:52
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Indexes and the trigger only exist on PostgreSQL, other databases use
+# the fallback search of planetarium.services.search
+FORWARD_SQL = [
+    """
+    CREATE FUNCTION planetarium_astronomyshow_search_vector() RETURNS trigger
+    AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A')
+            || setweight(
+                to_tsvector('english', coalesce(NEW.description, '')), 'B'
+            );
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER planetarium_astronomyshow_search_vector
+    BEFORE INSERT OR UPDATE OF title, description
+    ON planetarium_astronomyshow
+    FOR EACH ROW EXECUTE FUNCTION planetarium_astronomyshow_search_vector()
+    """,
+    """
+    UPDATE planetarium_astronomyshow SET title = title
+    """,
+    """
+    CREATE INDEX planetarium_astronomyshow_search_idx
+    ON planetarium_astronomyshow USING gin (search_vector)
+    """,
+    """
+    CREATE INDEX planetarium_astronomyshow_title_trgm_idx
+    ON planetarium_astronomyshow USING gin (title gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX planetarium_showtheme_name_trgm_idx
+    ON planetarium_showtheme USING gin (name gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX planetarium_planetariumdome_name_trgm_idx
+    ON planetarium_planetariumdome USING gin (name gin_trgm_ops)
+    """,
+]
+
+REVERSE_SQL = [
+    "DROP INDEX planetarium_planetariumdome_name_trgm_idx",
+    "DROP INDEX planetarium_showtheme_name_trgm_idx",
+    "DROP INDEX planetarium_astronomyshow_title_trgm_idx",
+    "DROP INDEX planetarium_astronomyshow_search_idx",
+    """
+    DROP TRIGGER planetarium_astronomyshow_search_vector
+    ON planetarium_astronomyshow
+    """,
+    "DROP FUNCTION planetarium_astronomyshow_search_vector()",
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("planetarium", "0009_query_indexes"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="astronomyshow",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(
+            run_on_postgresql(FORWARD_SQL), run_on_postgresql(REVERSE_SQL)
+        ),
+    ]
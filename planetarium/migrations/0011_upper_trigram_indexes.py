@@ -0,0 +1,59 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:05
+
+from django.db import migrations
+
+# icontains compiles to UPPER(column::text) LIKE UPPER(...) on PostgreSQL,
+# which the trigram indexes on the raw columns of 0010 cannot serve. Those
+# stay for the trigram_similar lookups of the search, except the theme
+# name one, which only icontains used.
+FORWARD_SQL = [
+    """
+    CREATE INDEX planetarium_astronomyshow_title_upper_trgm_idx
+    ON planetarium_astronomyshow
+    USING gin ((UPPER(title::text)) gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX planetarium_planetariumdome_name_upper_trgm_idx
+    ON planetarium_planetariumdome
+    USING gin ((UPPER(name::text)) gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX planetarium_showtheme_name_upper_trgm_idx
+    ON planetarium_showtheme
+    USING gin ((UPPER(name::text)) gin_trgm_ops)
+    """,
+    "DROP INDEX planetarium_showtheme_name_trgm_idx",
+]
+
+REVERSE_SQL = [
+    """
+    CREATE INDEX planetarium_showtheme_name_trgm_idx
+    ON planetarium_showtheme USING gin (name gin_trgm_ops)
+    """,
+    "DROP INDEX planetarium_showtheme_name_upper_trgm_idx",
+    "DROP INDEX planetarium_planetariumdome_name_upper_trgm_idx",
+    "DROP INDEX planetarium_astronomyshow_title_upper_trgm_idx",
+]
+
+
+def run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("planetarium", "0010_astronomyshow_search"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_on_postgresql(FORWARD_SQL), run_on_postgresql(REVERSE_SQL)
+        ),
+    ]
@@ -1,5 +1,8 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
 
 from planetarium_service import settings
 
@@ -10,6 +13,10 @@ class AstronomyShow(models.Model):
     show_theme = models.ForeignKey(
         "ShowTheme", on_delete=models.DO_NOTHING, null=True, blank=True
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Weighted title and description, kept up to date by a trigger on
+    # PostgreSQL, see planetarium.services.search
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.title
@@ -23,6 +30,7 @@ class PlanetariumDome(models.Model):
     seats_in_row = models.IntegerField(
         validators=[MinValueValidator(1), MaxValueValidator(100)]
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
     @property
     def capacity(self) -> int:
@@ -41,6 +49,7 @@ class Reservation(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=["user", "created_at", "id"])]
 
     @property
     def formatted_created_at(self):
@@ -52,6 +61,7 @@ class Reservation(models.Model):
 
 class ShowTheme(models.Model):
     name = models.CharField(max_length=200, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -64,24 +74,150 @@ class ShowSession(models.Model):
         on_delete=models.CASCADE
     )
     show_time = models.DateTimeField()
+    tickets_sold = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-show_time"]
+        indexes = [
+            # nearest_show and the keyset pages of the list
+            models.Index(fields=["show_time", "id"]),
+            models.Index(fields=["planetarium_dome", "show_time"]),
+        ]
 
     def __str__(self):
         return f"{self.astronomy_show.title} at {self.show_time}"
 
+    def save(self, *args, update_fields=None, **kwargs):
+        # tickets_sold is only changed by F() updates of the ticket code, a
+        # loaded copy written back would undo the tickets sold meanwhile
+        if not self._state.adding:
+            if update_fields is None:
+                update_fields = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name != "tickets_sold"
+                ]
+            else:
+                update_fields = [
+                    name for name in update_fields if name != "tickets_sold"
+                ]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+
+class TicketQuerySet(models.QuerySet):
+    def bulk_create(
+        self,
+        objs,
+        batch_size=None,
+        ignore_conflicts=False,
+        update_conflicts=False,
+        **kwargs,
+    ):
+        """Create tickets and count them into ShowSession.tickets_sold"""
+        # Every returned ticket is counted as sold, tickets skipped or
+        # updated on a conflict would be counted too
+        if ignore_conflicts or update_conflicts:
+            raise ValueError(
+                "Tickets can't be bulk created with ignore_conflicts or "
+                "update_conflicts, tickets_sold would count the conflicts."
+            )
+        with transaction.atomic(using=self.db):
+            tickets = super().bulk_create(objs, batch_size, **kwargs)
+            sold = {}
+            for ticket in tickets:
+                sold[ticket.show_session_id] = (
+                    sold.get(ticket.show_session_id, 0) + 1
+                )
+            for show_session_id, count in sold.items():
+                ShowSession.objects.using(self.db).filter(
+                    id=show_session_id
+                ).update(
+                    tickets_sold=F("tickets_sold") + count,
+                    updated_at=timezone.now(),
+                )
+        return tickets
+
 
 class Ticket(models.Model):
     row = models.IntegerField()
     seat = models.IntegerField()
     show_session = models.ForeignKey(ShowSession, on_delete=models.CASCADE)
     reservation = models.ForeignKey(Reservation, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TicketQuerySet.as_manager()
 
     class Meta:
         unique_together = ("show_session", "row", "seat")
         ordering = ["row", "seat"]
+        indexes = [models.Index(fields=["reservation", "row", "seat"])]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so the sold counters can follow a ticket moved
+        # to another session
+        instance._loaded_show_session_id = instance.__dict__.get(
+            "show_session_id"
+        )
+        return instance
 
     def __str__(self):
         return (f"Row: {self.row}, Seat: {self.seat}, "
                 f"ShowSession: {self.show_session}")
+
+
+class SeatHold(models.Model):
+    row = models.IntegerField()
+    seat = models.IntegerField()
+    show_session = models.ForeignKey(ShowSession, on_delete=models.CASCADE)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE
+    )
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("show_session", "row", "seat")
+        ordering = ["expires_at"]
+        # Active holds of a session, counted for every listed session
+        indexes = [models.Index(fields=["show_session", "expires_at"])]
+
+    def __str__(self):
+        return (f"Row: {self.row}, Seat: {self.seat}, "
+                f"held by {self.user} until {self.expires_at}")
+
+
+class Notification(models.Model):
+    """Outbox of messages to the ops chat, written with the booking"""
+
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    message = models.TextField()
+    show_session = models.ForeignKey(
+        ShowSession, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    tickets = models.PositiveIntegerField(default=0)
+    status = models.CharField(
+        max_length=7, choices=STATUS_CHOICES, default=PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.get_status_display()}: {self.message[:50]}"
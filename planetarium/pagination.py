@@ -0,0 +1,237 @@
+"""Pagination of the API.
+
+KeysetPagination pages through the model's Meta.ordering with the primary
+key as a tiebreaker and filters on the last row of the previous page, so
+deep pages cost as much as the first one and no COUNT(*) is run. Clients
+opt in with ?cursor= (empty for the first page) or ?page_size=, every
+other request keeps getting the offset pages with their count.
+"""
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import and_, or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from planetarium_service import settings
+
+
+class LimitOffsetPagination(pagination.LimitOffsetPagination):
+    """Offset pages, ?count=false skips the COUNT(*) query"""
+
+    count_query_param = "count"
+    max_limit = settings.MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.count_query_param) != "false":
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.count = None
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if self.count is not None:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = replace_query_param(
+            self.request.build_absolute_uri(),
+            self.limit_query_param,
+            self.limit,
+        )
+        return replace_query_param(
+            url, self.offset_query_param, self.offset + self.limit
+        )
+
+    def get_paginated_response(self, data):
+        if self.count is not None:
+            return super().get_paginated_response(data)
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+
+class KeysetPagination(pagination.BasePagination):
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+    max_page_size = settings.MAX_PAGE_SIZE
+    offset_pagination_class = LimitOffsetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (
+            self.cursor_query_param not in request.query_params
+            and self.page_size_query_param not in request.query_params
+        ):
+            self.offset_pagination = self.offset_pagination_class()
+            return self.offset_pagination.paginate_queryset(
+                queryset, request, view
+            )
+        self.offset_pagination = None
+
+        self.request = request
+        self.model = queryset.model
+        self.ordering = self.get_ordering(queryset)
+        page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request)
+
+        ordering = [
+            f"{'-' if descending != reverse else ''}{name}"
+            for name, descending in self.ordering
+        ]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.after(values, reverse))
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_row = self.previous_row = None
+        if rows:
+            if has_more or reverse:
+                self.next_row = rows[-1]
+            if values is not None and (has_more or not reverse):
+                self.previous_row = rows[0]
+        return rows
+
+    def get_ordering(self, queryset):
+        """Meta.ordering of the model as (field, descending) pairs, ending
+        with the primary key"""
+        ordering = [
+            (name.lstrip("-"), name.startswith("-"))
+            for name in queryset.model._meta.ordering
+        ]
+        if not any(name in ("pk", "id") for name, _ in ordering):
+            descending = ordering[-1][1] if ordering else False
+            ordering.append(("pk", descending))
+        return ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def after(self, values, reverse):
+        """Rows after the cursor values in the page direction"""
+        conditions = []
+        for index, (name, descending) in enumerate(self.ordering):
+            lookup = "lt" if descending != reverse else "gt"
+            equal = [
+                Q(**{field: value})
+                for (field, _), value in zip(self.ordering[:index], values)
+            ]
+            beyond = Q(**{f"{name}__{lookup}": values[index]})
+            conditions.append(reduce(and_, equal, beyond))
+        return reduce(or_, conditions)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values, reverse = cursor["v"], bool(cursor["r"])
+            if (
+                not isinstance(values, list)
+                or len(values) != len(self.ordering)
+            ):
+                raise ValueError
+            values = [
+                self.get_field(name).to_python(value)
+                for (name, _), value in zip(self.ordering, values)
+            ]
+        except (
+            binascii.Error, ValueError, TypeError, KeyError, ValidationError
+        ):
+            raise NotFound("Invalid cursor")
+        return values, reverse
+
+    def get_field(self, name):
+        if name == "pk":
+            return self.model._meta.pk
+        return self.model._meta.get_field(name)
+
+    def encode_cursor(self, row, reverse):
+        values = [
+            self.get_field(name).value_to_string(row)
+            for name, _ in self.ordering
+        ]
+        cursor = json.dumps({"v": values, "r": int(reverse)})
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            base64.urlsafe_b64encode(cursor.encode()).decode(),
+        )
+
+    def get_next_link(self):
+        if self.next_row is None:
+            return None
+        return self.encode_cursor(self.next_row, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_row is None:
+            return None
+        return self.encode_cursor(self.previous_row, reverse=True)
+
+    def get_paginated_response(self, data):
+        if self.offset_pagination is not None:
+            return self.offset_pagination.get_paginated_response(data)
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        # Offset pages by default, cursor pages come without the count
+        offset_pagination = self.offset_pagination_class()
+        response_schema = offset_pagination.get_paginated_response_schema(
+            schema
+        )
+        response_schema["required"] = ["results"]
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            *self.offset_pagination_class().get_schema_operation_parameters(
+                view
+            ),
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Cursor of the page, from next or previous, "
+                "empty for the first page. Cursor pages have no count",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page",
+                "schema": {"type": "integer"},
+            },
+        ]
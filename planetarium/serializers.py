@@ -1,14 +1,29 @@
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
+from planetarium.cache import (
+    FragmentCacheMixin,
+    FragmentListSerializer,
+    prefetch_fragments,
+)
+from planetarium.exceptions import SeatsConflict
 from planetarium.models import (
     AstronomyShow,
     PlanetariumDome,
     Reservation,
+    SeatHold,
     ShowSession,
     ShowTheme,
     Ticket,
 )
+from planetarium.services.booking import (
+    SeatsUnavailable,
+    book_seats,
+    hold_seats,
+)
+from planetarium.services.seat_allocation import nearest_free_seats
+from planetarium.services.seat_map import get_seat_map
+from planetarium.services.typeahead import ASTRONOMY_SHOW, SHOW_THEME
 
 
 class ShowThemeSerializer(serializers.ModelSerializer):
@@ -27,11 +42,15 @@ class AstronomyShowListSerializer(serializers.ModelSerializer):
         fields = ("id", "title", "show_theme")
 
 
-class AstronomyShowRetrieveSerializer(AstronomyShowListSerializer):
+class AstronomyShowRetrieveSerializer(
+    FragmentCacheMixin, AstronomyShowListSerializer
+):
+    fragment_resources = ("astronomy_shows", "show_themes")
 
     class Meta:
         model = AstronomyShow
         fields = AstronomyShowListSerializer.Meta.fields + ("description",)
+        list_serializer_class = FragmentListSerializer
 
 
 class AstronomyShowCreateUpdateSerializer(AstronomyShowRetrieveSerializer):
@@ -40,10 +59,15 @@ class AstronomyShowCreateUpdateSerializer(AstronomyShowRetrieveSerializer):
     )
 
 
-class PlanetariumDomeSerializer(serializers.ModelSerializer):
+class PlanetariumDomeSerializer(
+    FragmentCacheMixin, serializers.ModelSerializer
+):
+    fragment_resources = ("planetarium_domes",)
+
     class Meta:
         model = PlanetariumDome
         fields = ("id", "name", "rows", "seats_in_row", "capacity")
+        list_serializer_class = FragmentListSerializer
 
 
 class PlanetariumDomeShowSessionsSerializer(serializers.ModelSerializer):
@@ -80,11 +104,26 @@ class ShowSessionsListSerializer(serializers.ModelSerializer):
         )
 
 
+class ShowSessionsUpcomingSerializer(ShowSessionsListSerializer):
+    show_time = serializers.DateTimeField(format="%Y-%m-%d, %H:%M")
+
+
 class ShowSessionsRetrieveSerializer(ShowSessionsListSerializer):
     show_time = serializers.DateTimeField(format="%Y-%m-%d, %H:%M")
     astronomy_show = AstronomyShowRetrieveSerializer(read_only=False)
     planetarium_dome = PlanetariumDomeSerializer(read_only=False)
 
+    def to_representation(self, instance):
+        # Both nested fragments come from the cache in one round trip
+        prefetch_fragments(
+            self.context,
+            [
+                (self.fields["astronomy_show"], instance.astronomy_show),
+                (self.fields["planetarium_dome"], instance.planetarium_dome),
+            ],
+        )
+        return super().to_representation(instance)
+
 
 class ShowSessionsCreateUpdateSerializer(ShowSessionsListSerializer):
     astronomy_show = serializers.PrimaryKeyRelatedField(
@@ -131,12 +170,17 @@ class TicketRetrieveSerializer(TicketListSerializer):
 
 class TicketCreateSerializer(serializers.ModelSerializer):
     show_session = serializers.PrimaryKeyRelatedField(
-        queryset=ShowSession.objects.all()
+        queryset=ShowSession.objects.select_related(
+            "astronomy_show", "planetarium_dome"
+        )
     )
 
     class Meta:
         model = Ticket
         fields = ("id", "row", "seat", "show_session")
+        # Taken seats are reported by booking as a conflict, checking the
+        # unique constraint up front would only cost another query
+        validators = []
 
     def validate(self, data):
         row = data["row"]
@@ -160,11 +204,16 @@ class TicketCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         request = self.context.get("request")
         user = request.user
+        seats = [(validated_data["row"], validated_data["seat"])]
 
-        reservation = Reservation.objects.create(user=user)
-        validated_data["reservation"] = reservation
-
-        ticket = Ticket.objects.create(**validated_data)
+        try:
+            _, (ticket,) = book_seats(
+                user, validated_data["show_session"], seats
+            )
+        except SeatsUnavailable as error:
+            raise seats_conflict(
+                validated_data["show_session"], seats, error.seats
+            )
         return ticket
 
     def update(self, instance, validated_data):
@@ -180,3 +229,144 @@ class TicketCreateSerializer(serializers.ModelSerializer):
         instance.save()
 
         return instance
+
+
+def seats_conflict(show_session, seats, conflicts):
+    """Conflict error suggesting free seats near the requested ones"""
+    suggestions = nearest_free_seats(
+        get_seat_map(show_session), conflicts, exclude=seats
+    )
+    return SeatsConflict(conflicts, suggestions)
+
+
+def validate_seats(planetarium_dome, seats):
+    """Check (row, seat) pairs against the dome geometry in one pass"""
+    errors = []
+    for row, seat in seats:
+        if not 1 <= row <= planetarium_dome.rows:
+            errors.append(
+                f"Invalid row number {row}. It must be between 1 and "
+                f"{planetarium_dome.rows}."
+            )
+        if not 1 <= seat <= planetarium_dome.seats_in_row:
+            errors.append(
+                f"Invalid seat number {seat}. It must be between 1 and "
+                f"{planetarium_dome.seats_in_row}."
+            )
+    if len(set(seats)) != len(seats):
+        errors.append("The same seat is requested more than once.")
+    return errors
+
+
+class SeatSerializer(serializers.Serializer):
+    row = serializers.IntegerField()
+    seat = serializers.IntegerField()
+
+
+class SeatAllocationSerializer(serializers.Serializer):
+    party_size = serializers.IntegerField(min_value=1, max_value=100)
+
+
+class ReservationBookingSerializer(serializers.Serializer):
+    """Books several seats of one show session under a single reservation"""
+
+    show_session = serializers.PrimaryKeyRelatedField(
+        queryset=ShowSession.objects.select_related(
+            "astronomy_show", "planetarium_dome"
+        )
+    )
+    tickets = SeatSerializer(many=True, allow_empty=False)
+
+    def validate(self, data):
+        seats = [(ticket["row"], ticket["seat"]) for ticket in data["tickets"]]
+        errors = validate_seats(data["show_session"].planetarium_dome, seats)
+        if errors:
+            raise ValidationError({"tickets": errors})
+        return data
+
+    def create(self, validated_data):
+        request = self.context.get("request")
+        seats = [
+            (ticket["row"], ticket["seat"])
+            for ticket in validated_data["tickets"]
+        ]
+
+        try:
+            reservation, _ = book_seats(
+                request.user, validated_data["show_session"], seats
+            )
+        except SeatsUnavailable as error:
+            raise seats_conflict(
+                validated_data["show_session"], seats, error.seats
+            )
+        return reservation
+
+
+class ReservationTicketSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Ticket
+        fields = ("id", "row", "seat", "show_session")
+
+
+class ReservationBookingResultSerializer(ReservationSerializer):
+    tickets = ReservationTicketSerializer(
+        source="ticket_set", many=True, read_only=True
+    )
+
+    class Meta:
+        model = Reservation
+        fields = ReservationSerializer.Meta.fields + ("tickets",)
+
+
+class SeatHoldSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SeatHold
+        fields = ("id", "row", "seat", "show_session", "expires_at")
+
+
+class SeatHoldCreateSerializer(serializers.Serializer):
+    """Holds seats of one show session until they are booked or expire"""
+
+    show_session = serializers.PrimaryKeyRelatedField(
+        queryset=ShowSession.objects.select_related("planetarium_dome")
+    )
+    seats = SeatSerializer(many=True, allow_empty=False)
+
+    def validate(self, data):
+        seats = [(seat["row"], seat["seat"]) for seat in data["seats"]]
+        errors = validate_seats(data["show_session"].planetarium_dome, seats)
+        if errors:
+            raise ValidationError({"seats": errors})
+        return data
+
+    def create(self, validated_data):
+        request = self.context.get("request")
+        seats = [
+            (seat["row"], seat["seat"]) for seat in validated_data["seats"]
+        ]
+
+        try:
+            return hold_seats(
+                request.user, validated_data["show_session"], seats
+            )
+        except SeatsUnavailable as error:
+            raise seats_conflict(
+                validated_data["show_session"], seats, error.seats
+            )
+
+
+class TypeaheadSerializer(serializers.Serializer):
+    """Completion of a show title or theme name"""
+
+    type = serializers.ChoiceField(choices=[ASTRONOMY_SHOW, SHOW_THEME])
+    id = serializers.IntegerField()
+    label = serializers.CharField()
+
+
+class ShowSessionsCalendarDaySerializer(serializers.Serializer):
+    """Sessions of one day of the schedule"""
+
+    date = serializers.DateField()
+    sessions = serializers.IntegerField()
+    capacity = serializers.IntegerField()
+    tickets_available = serializers.IntegerField(source="available")
@@ -0,0 +1,327 @@
+import random
+import time
+
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from planetarium import metrics
+from planetarium.models import Reservation, SeatHold, ShowSession, Ticket
+from planetarium.services.notifications import notify_booking
+from planetarium.services.seat_claims import (
+    claim_seats,
+    expired_claims,
+    release_seats,
+    renew_claims,
+)
+from planetarium.services.seat_map import invalidate_seat_map
+from planetarium_service import settings
+
+
+# SQLSTATE of serialization failures and deadlocks, worth another attempt
+RETRYABLE_PGCODES = ("40001", "40P01")
+BOOKING_ATTEMPTS = 3
+BOOKING_RETRY_DELAY = 0.05
+
+
+class SeatsUnavailable(Exception):
+    def __init__(self, seats):
+        self.seats = sorted(seats)
+        super().__init__(
+            ", ".join(f"Row: {row}, Seat: {seat}" for row, seat in self.seats)
+        )
+
+
+def seats_filter(seats):
+    query = Q()
+    for row, seat in seats:
+        query |= Q(row=row, seat=seat)
+    return query
+
+
+def _unavailable_seats(show_session, seats, user):
+    """Seats among ``seats`` that are sold or held by another user"""
+    sold = Ticket.objects.filter(
+        seats_filter(seats), show_session=show_session
+    ).values_list("row", "seat")
+    held = SeatHold.objects.filter(
+        seats_filter(seats),
+        show_session=show_session,
+        expires_at__gt=timezone.now(),
+    ).exclude(user=user).values_list("row", "seat")
+    return set(sold) | set(held)
+
+
+def _occupied_seats(show_session, seats):
+    """Seats among ``seats`` that are sold or under an active hold"""
+    if not seats:
+        return set()
+    sold = Ticket.objects.filter(
+        seats_filter(seats), show_session=show_session
+    ).values_list("row", "seat")
+    held = SeatHold.objects.filter(
+        seats_filter(seats),
+        show_session=show_session,
+        expires_at__gt=timezone.now(),
+    ).values_list("row", "seat")
+    return set(sold) | set(held)
+
+
+def _claim_seats(show_session, seats):
+    """claim_seats that drops conflicting claims the database does not back.
+
+    A claim outlives its booking when the worker dies before releasing it,
+    or its hold when the hold expires. Conflicting claims past their lease
+    are checked against tickets and active holds: the ones without either
+    are released and claimed once more, the others get a new lease. Younger
+    claims may belong to a booking not committed yet and are a conflict.
+    """
+    taken = claim_seats(show_session, seats)
+    expired = expired_claims(show_session, taken) if taken else []
+    if not expired:
+        return taken
+    occupied = _occupied_seats(show_session, expired)
+    if occupied:
+        renew_claims(show_session, occupied)
+    stale = set(expired) - occupied
+    if not stale:
+        return taken
+    metrics.increment("booking.stale_claims")
+    release_seats(show_session, stale)
+    return claim_seats(show_session, seats)
+
+
+def _release_unoccupied(show_session, seats):
+    """Release claims after a failed booking or hold, except the ones of
+    seats a competing request sold or held meanwhile"""
+    free = set(seats) - _occupied_seats(show_session, seats)
+    if free:
+        release_seats(show_session, free)
+
+
+def _lock_show_session(show_session):
+    """Serialize the bookings and holds of a session, so the check each
+    makes sees what the other committed"""
+    list(
+        ShowSession.objects.select_for_update()
+        .filter(id=show_session.id)
+        .values_list("id", flat=True)
+    )
+
+
+def _own_holds(user, show_session, seats):
+    return SeatHold.objects.filter(
+        seats_filter(seats),
+        show_session=show_session,
+        user=user,
+        expires_at__gt=timezone.now(),
+    )
+
+
+def _claim(user, show_session, seats):
+    """Claim seats that are not held by the user yet.
+
+    Seats the user holds are already claimed, so they are only looked up
+    when the claim reports a conflict. Returns the seats claimed here.
+    """
+    taken = _claim_seats(show_session, seats)
+    if not taken:
+        return seats
+
+    own = set(_own_holds(user, show_session, taken).values_list("row", "seat"))
+    if own != set(taken):
+        metrics.increment("booking.claim_conflicts")
+        raise SeatsUnavailable(set(taken) - own)
+
+    rest = [seat for seat in seats if seat not in own]
+    if rest and _claim_seats(show_session, rest):
+        metrics.increment("booking.claim_conflicts")
+        raise SeatsUnavailable(_unavailable_seats(show_session, seats, user))
+    return rest
+
+
+def _is_retryable(error):
+    return getattr(error.__cause__, "pgcode", None) in RETRYABLE_PGCODES
+
+
+def _with_retries(operation):
+    """Run a transactional operation, retrying serialization failures.
+
+    Retrying is only possible when the operation owns its transaction, so
+    inside an outer atomic block the failure is raised right away.
+    """
+    attempts = BOOKING_ATTEMPTS
+    if transaction.get_connection().in_atomic_block:
+        attempts = 1
+    for attempt in range(1, attempts + 1):
+        started = time.monotonic()
+        try:
+            with transaction.atomic():
+                return operation()
+        except OperationalError as error:
+            if not _is_retryable(error) or attempt == attempts:
+                raise
+            metrics.increment("booking.serialization_retries")
+            time.sleep(BOOKING_RETRY_DELAY * attempt * random.random())
+        finally:
+            metrics.increment("booking.transactions")
+            metrics.increment(
+                "booking.transaction_ms",
+                round((time.monotonic() - started) * 1000),
+            )
+
+
+def book_seats(user, show_session, seats):
+    """Create one reservation with a ticket for every (row, seat) pair.
+
+    Seats held by the user are turned into tickets and their holds are
+    removed in the same transaction, together with queueing the booking
+    notification. Raises SeatsUnavailable when any seat is sold or held by
+    someone else, in which case nothing is booked.
+
+    The claims only turn competing requests away early, the holds of other
+    users are checked again in the transaction, so they are kept when the
+    claims are unavailable.
+    """
+    claimed = _claim(user, show_session, seats)
+
+    def book():
+        _lock_show_session(show_session)
+        held = set(
+            SeatHold.objects.select_for_update()
+            .filter(
+                seats_filter(seats),
+                show_session=show_session,
+                expires_at__gt=timezone.now(),
+            )
+            .exclude(user=user)
+            .values_list("row", "seat")
+        )
+        if held:
+            raise SeatsUnavailable(held)
+        SeatHold.objects.filter(
+            seats_filter(seats), show_session=show_session, user=user
+        ).delete()
+        reservation = Reservation.objects.create(user=user)
+        tickets = Ticket.objects.bulk_create(
+            Ticket(
+                row=row,
+                seat=seat,
+                show_session=show_session,
+                reservation=reservation,
+            )
+            for row, seat in seats
+        )
+        notify_booking(user, show_session, seats)
+        invalidate_seat_map(show_session.id)
+        return reservation, tickets
+
+    try:
+        return _with_retries(book)
+    except IntegrityError:
+        metrics.increment("booking.integrity_conflicts")
+        _release_unoccupied(show_session, claimed)
+        raise SeatsUnavailable(_unavailable_seats(show_session, seats, user))
+    except SeatsUnavailable:
+        metrics.increment("booking.hold_conflicts")
+        _release_unoccupied(show_session, claimed)
+        raise
+    except BaseException:
+        release_seats(show_session, claimed)
+        raise
+
+
+def _touch_show_sessions(show_session_ids):
+    """Holds change the seats available, so the sessions count as modified
+    for conditional requests"""
+    ShowSession.objects.filter(id__in=show_session_ids).update(
+        updated_at=timezone.now()
+    )
+
+
+def hold_seats(user, show_session, seats, timeout=None):
+    """Keep seats for the user until the hold expires or is booked"""
+    expires_at = timezone.now() + (timeout or settings.SEAT_HOLD_TIMEOUT)
+    # Seats of expired holds that were not swept yet are free again
+    taken = _claim_seats(show_session, seats)
+    if taken:
+        raise SeatsUnavailable(taken)
+
+    try:
+        with transaction.atomic():
+            _lock_show_session(show_session)
+            sold = set(
+                Ticket.objects.filter(
+                    seats_filter(seats), show_session=show_session
+                ).values_list("row", "seat")
+            )
+            if sold:
+                raise SeatsUnavailable(sold)
+            SeatHold.objects.filter(
+                seats_filter(seats),
+                show_session=show_session,
+                expires_at__lte=timezone.now(),
+            ).delete()
+            holds = SeatHold.objects.bulk_create(
+                SeatHold(
+                    row=row,
+                    seat=seat,
+                    show_session=show_session,
+                    user=user,
+                    expires_at=expires_at,
+                )
+                for row, seat in seats
+            )
+            _touch_show_sessions([show_session.id])
+            invalidate_seat_map(show_session.id)
+    except IntegrityError:
+        _release_unoccupied(show_session, seats)
+        raise SeatsUnavailable(_unavailable_seats(show_session, seats, user))
+    except SeatsUnavailable:
+        _release_unoccupied(show_session, seats)
+        raise
+    except BaseException:
+        release_seats(show_session, seats)
+        raise
+    return holds
+
+
+def _release_held_seats(show_session, seats):
+    """Free the claims of released holds once the release is committed,
+    unless their seats were booked or held again meanwhile"""
+    transaction.on_commit(
+        lambda: _release_unoccupied(show_session, seats)
+    )
+
+
+def release_expired_holds():
+    """Delete every expired hold with one query and free their seats"""
+    with transaction.atomic():
+        expired = list(
+            SeatHold.objects.select_for_update()
+            .filter(expires_at__lte=timezone.now())
+            .values_list("id", "show_session_id", "row", "seat")
+        )
+        if not expired:
+            return 0
+        seats = {}
+        for _, show_session_id, row, seat in expired:
+            seats.setdefault(show_session_id, []).append((row, seat))
+
+        count, _ = SeatHold.objects.filter(
+            id__in=[hold_id for hold_id, *_ in expired]
+        ).delete()
+        _touch_show_sessions(list(seats))
+        for show_session in ShowSession.objects.filter(
+            id__in=seats
+        ).select_related("planetarium_dome"):
+            invalidate_seat_map(show_session.id)
+            _release_held_seats(show_session, seats[show_session.id])
+    return count
+
+
+def release_hold(hold):
+    hold.delete()
+    _touch_show_sessions([hold.show_session_id])
+    invalidate_seat_map(hold.show_session_id)
+    _release_held_seats(hold.show_session, [(hold.row, hold.seat)])
@@ -0,0 +1,249 @@
+"""Delivery of the notification outbox.
+
+Bookings only insert Notification rows in their own transaction; the
+send_notifications command picks pending rows up and delivers them, so a
+slow or unreachable Bot API never holds a request.
+
+In digest mode the pending bookings of a show session are coalesced into
+one message once the oldest of them waited for the flush interval or they
+add up to the flush size. Single mode falls back to digests whenever the
+backlog grows over the limit, which keeps a sale within the Bot API rate
+limits instead of falling further behind.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from planetarium.models import Notification, ShowSession
+from planetarium.services.telegram_bot import TransportError
+from planetarium_service import settings
+
+logger = logging.getLogger(__name__)
+
+
+def booking_message(user, show_session, seats):
+    if len(seats) == 1:
+        ((row, seat),) = seats
+        return (
+            f"New ticket created by {user.email}\n"
+            f"Event: {show_session.astronomy_show.title}\n"
+            f"Row: {row}, Seat: {seat}\n"
+            f"Time: {show_session.show_time}"
+        )
+    seats = ", ".join(f"Row: {row}, Seat: {seat}" for row, seat in seats)
+    return (
+        f"New reservation created by {user.email}\n"
+        f"Event: {show_session.astronomy_show.title}\n"
+        f"Seats: {seats}\n"
+        f"Time: {show_session.show_time}"
+    )
+
+
+def notify_booking(user, show_session, seats):
+    """Queue the booking message, meant to run in the booking transaction"""
+    return Notification.objects.create(
+        message=booking_message(user, show_session, seats),
+        show_session=show_session,
+        tickets=len(seats),
+    )
+
+
+def digest_message(show_session, tickets):
+    show_time = timezone.localtime(show_session.show_time)
+    tickets_left = (
+        show_session.planetarium_dome.capacity - show_session.tickets_sold
+    )
+    return (
+        f"{show_session.astronomy_show.title} "
+        f"{show_time:%Y-%m-%d %H:%M} — "
+        f"{tickets} new tickets, {tickets_left} left"
+    )
+
+
+def retry_delay(attempts, retry_after=None):
+    """Exponential backoff after the given number of failed attempts"""
+    delay = min(
+        settings.NOTIFICATIONS["RETRY_BACKOFF"] * 2 ** (attempts - 1),
+        settings.NOTIFICATIONS["MAX_RETRY_BACKOFF"],
+    )
+    if retry_after:
+        delay = max(delay, timedelta(seconds=retry_after))
+    return delay
+
+
+def _due():
+    return Notification.objects.filter(
+        status=Notification.PENDING, next_attempt_at__lte=timezone.now()
+    )
+
+
+def send_pending_notifications(transport, batch_size=None, mode=None):
+    """Deliver one batch of due notifications and return how many were sent.
+
+    A batch is claimed in a short transaction with SKIP LOCKED and a lease,
+    and every message is marked sent on its own right after it went out,
+    so several workers can drain the outbox without holding transactions
+    open across HTTP calls, and a worker that dies only leaves the unsent
+    rest of its batch to be retried once the lease runs out.
+    """
+    mode = mode or settings.NOTIFICATIONS["MODE"]
+    batch_size = batch_size or settings.NOTIFICATIONS["BATCH_SIZE"]
+    if mode == "digest" or (
+        _due().count() > settings.NOTIFICATIONS["BACKLOG_LIMIT"]
+    ):
+        return send_digests(transport, batch_size) + _send_each(
+            transport, _due().filter(show_session=None), batch_size
+        )
+    return _send_each(transport, _due(), batch_size)
+
+
+def _claim(due, batch_size):
+    """Lease up to batch_size due notifications to this worker"""
+    with transaction.atomic():
+        ids = list(
+            due.select_for_update(skip_locked=True)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        Notification.objects.filter(id__in=ids).update(
+            next_attempt_at=(
+                timezone.now() + settings.NOTIFICATIONS["LEASE_TIMEOUT"]
+            )
+        )
+    return ids
+
+
+def _release(ids, delay=timedelta(0)):
+    """Make claimed notifications due again after delay"""
+    Notification.objects.filter(
+        id__in=ids, status=Notification.PENDING
+    ).update(next_attempt_at=timezone.now() + delay)
+
+
+def _sent(ids):
+    Notification.objects.filter(id__in=ids).update(
+        status=Notification.SENT,
+        sent_at=timezone.now(),
+        attempts=F("attempts") + 1,
+    )
+
+
+def _send_each(transport, due, batch_size):
+    notifications = list(
+        Notification.objects.filter(id__in=_claim(due, batch_size))
+    )
+    sent = 0
+    for index, notification in enumerate(notifications):
+        try:
+            transport.send(notification.message)
+        except TransportError as error:
+            logger.warning(
+                "Notification %s failed: %s", notification.id, error
+            )
+            _failed(notification, error)
+            if error.retry_after:
+                # Rate limited, the rest of the batch would fail as well
+                _release(
+                    [rest.id for rest in notifications[index + 1:]],
+                    timedelta(seconds=error.retry_after),
+                )
+                break
+            continue
+        _sent([notification.id])
+        sent += 1
+    return sent
+
+
+def _failed(notification, error):
+    notification.attempts += 1
+    notification.last_error = str(error)
+    if notification.attempts >= settings.NOTIFICATIONS["MAX_ATTEMPTS"]:
+        notification.status = Notification.FAILED
+    else:
+        notification.next_attempt_at = timezone.now() + retry_delay(
+            notification.attempts, error.retry_after
+        )
+    notification.save(
+        update_fields=["attempts", "last_error", "status", "next_attempt_at"]
+    )
+
+
+def send_digests(transport, batch_size=None):
+    """Send one message per show session for the due bookings.
+
+    Returns how many notifications were covered by the sent messages.
+    """
+    batch_size = batch_size or settings.NOTIFICATIONS["BATCH_SIZE"]
+    flush_before = timezone.now() - settings.NOTIFICATIONS["FLUSH_INTERVAL"]
+    pending = (
+        Notification.objects.filter(
+            id__in=_claim(_due().exclude(show_session=None), batch_size)
+        )
+        .order_by("id")
+        .values_list("id", "show_session_id", "tickets", "created_at")
+    )
+    groups = {}
+    for notification_id, show_session_id, tickets, created_at in pending:
+        group = groups.setdefault(
+            show_session_id, {"ids": [], "tickets": 0, "oldest": None}
+        )
+        group["ids"].append(notification_id)
+        group["tickets"] += tickets
+        group["oldest"] = group["oldest"] or created_at
+
+    show_sessions = ShowSession.objects.select_related(
+        "astronomy_show", "planetarium_dome"
+    ).in_bulk(groups)
+    sent = 0
+    waiting = []
+    groups = list(groups.items())
+    for index, (show_session_id, group) in enumerate(groups):
+        if (
+            group["oldest"] > flush_before
+            and group["tickets"] < settings.NOTIFICATIONS["FLUSH_SIZE"]
+        ):
+            waiting.extend(group["ids"])
+            continue
+        message = digest_message(
+            show_sessions[show_session_id], group["tickets"]
+        )
+        try:
+            transport.send(message)
+        except TransportError as error:
+            logger.warning(
+                "Digest of session %s failed: %s", show_session_id, error
+            )
+            _digest_failed(group["ids"], error)
+            if error.retry_after:
+                _release(
+                    [
+                        notification_id
+                        for _, rest in groups[index + 1:]
+                        for notification_id in rest["ids"]
+                    ],
+                    timedelta(seconds=error.retry_after),
+                )
+                break
+            continue
+        _sent(group["ids"])
+        sent += len(group["ids"])
+    _release(waiting)
+    return sent
+
+
+def _digest_failed(ids, error):
+    notifications = Notification.objects.filter(id__in=ids)
+    attempts = max(notifications.values_list("attempts", flat=True)) + 1
+    notifications.update(
+        attempts=F("attempts") + 1,
+        last_error=str(error),
+        next_attempt_at=timezone.now() + retry_delay(
+            attempts, error.retry_after
+        ),
+    )
+    notifications.filter(
+        attempts__gte=settings.NOTIFICATIONS["MAX_ATTEMPTS"]
+    ).update(status=Notification.FAILED)
@@ -0,0 +1,65 @@
+"""Search over astronomy shows and planetarium domes.
+
+On PostgreSQL shows are matched against the search_vector column with
+websearch syntax and ranked, and titles within trigram similarity catch
+typos. The trigram indexes of migration 0010 serve the similarity
+lookups, the ones of 0011 on UPPER() of the columns serve icontains,
+which PostgreSQL runs as UPPER(column) LIKE UPPER(pattern). Other
+databases, SQLite in tests, fall back to matching every word with
+icontains.
+"""
+from functools import reduce
+from operator import and_, or_
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    TrigramSimilarity,
+)
+from django.db import connections
+from django.db.models import F, Q
+
+SEARCH_CONFIG = "english"
+
+
+def _is_postgresql(queryset):
+    return connections[queryset.db].vendor == "postgresql"
+
+
+def _every_word(fields, terms):
+    return reduce(
+        and_,
+        (
+            reduce(
+                or_, (Q(**{f"{field}__icontains": word}) for field in fields)
+            )
+            for word in terms.split()
+        ),
+        Q(),
+    )
+
+
+def search_astronomy_shows(queryset, terms):
+    """Shows matching the terms, best matches first"""
+    if not _is_postgresql(queryset):
+        return queryset.filter(_every_word(["title", "description"], terms))
+
+    query = SearchQuery(terms, config=SEARCH_CONFIG, search_type="websearch")
+    return queryset.annotate(
+        rank=SearchRank(F("search_vector"), query),
+        similarity=TrigramSimilarity("title", terms),
+    ).filter(
+        Q(search_vector=query) | Q(title__trigram_similar=terms)
+    ).order_by("-rank", "-similarity", "id")
+
+
+def search_planetarium_domes(queryset, name):
+    """Domes whose name contains or resembles name, closest first"""
+    if not _is_postgresql(queryset):
+        return queryset.filter(name__icontains=name)
+
+    return queryset.annotate(
+        similarity=TrigramSimilarity("name", name),
+    ).filter(
+        Q(name__icontains=name) | Q(name__trigram_similar=name)
+    ).order_by("-similarity", "id")
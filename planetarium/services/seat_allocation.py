@@ -0,0 +1,106 @@
+"""Best available contiguous seats for a party.
+
+Occupancy is taken from the cached seat map and split into one integer per
+row, where bit ``k`` stands for seat ``seats_in_row - k``. The starts of all
+free blocks of a row are found with a handful of shifts, and only the start
+nearest to the middle of the row is considered, so a dome is searched in
+one step per row.
+"""
+import base64
+
+
+def row_masks(seat_map):
+    """Split a seat map into per-row integers of occupied seats"""
+    rows = seat_map["rows"]
+    seats_in_row = seat_map["seats_in_row"]
+    bitmap = base64.b64decode(seat_map["bitmap"])
+    occupied = int.from_bytes(bitmap, "big")
+    total = len(bitmap) * 8
+    full = (1 << seats_in_row) - 1
+    return [
+        (occupied >> (total - (row + 1) * seats_in_row)) & full
+        for row in range(rows)
+    ]
+
+
+def _nearest_bit(mask, target):
+    """Position of the set bit of ``mask`` closest to ``target``"""
+    low = int(target)
+    candidates = []
+    above = mask >> low
+    if above:
+        candidates.append(low + (above & -above).bit_length() - 1)
+    below = mask & ((1 << low) - 1)
+    if below:
+        candidates.append(below.bit_length() - 1)
+    return min(candidates, key=lambda bit: abs(bit - target))
+
+
+def allocate_seats(seat_map, party_size, exclude=()):
+    """Pick ``party_size`` adjacent seats in one row nearest to the centre.
+
+    Returns a list of (row, seat) pairs, or None when no row has a free
+    block of that size. Seats in ``exclude`` are treated as occupied.
+    """
+    seats_in_row = seat_map["seats_in_row"]
+    if not 1 <= party_size <= seats_in_row:
+        return None
+
+    masks = row_masks(seat_map)
+    for row, seat in exclude:
+        masks[row - 1] |= 1 << (seats_in_row - seat)
+
+    full = (1 << seats_in_row) - 1
+    centre_row = (len(masks) - 1) / 2
+    centre_start = (seats_in_row - party_size) / 2
+    best = None
+    for row, occupied in enumerate(masks):
+        # Widen runs of free seats by doubling until they cover the party
+        starts = full & ~occupied
+        length = 1
+        while length < party_size and starts:
+            step = min(length, party_size - length)
+            starts &= starts >> step
+            length += step
+        if not starts:
+            continue
+        start = _nearest_bit(starts, centre_start)
+        score = (row - centre_row) ** 2 + (start - centre_start) ** 2
+        if best is None or score < best[0]:
+            best = (score, row, start)
+
+    if best is None:
+        return None
+    _, row, start = best
+    first_seat = seats_in_row - start - party_size + 1
+    return [
+        (row + 1, seat) for seat in range(first_seat, first_seat + party_size)
+    ]
+
+
+def nearest_free_seats(seat_map, seats, exclude=()):
+    """Suggest a free seat close to each of ``seats``.
+
+    Every seat gets the nearest free seat of its own row, or of the closest
+    row that has one. Suggestions are not repeated, and seats in
+    ``exclude`` are treated as occupied.
+    """
+    seats_in_row = seat_map["seats_in_row"]
+    masks = row_masks(seat_map)
+    for row, seat in list(exclude) + list(seats):
+        masks[row - 1] |= 1 << (seats_in_row - seat)
+
+    full = (1 << seats_in_row) - 1
+    suggestions = []
+    for row, seat in seats:
+        candidates = sorted(
+            range(len(masks)), key=lambda index: abs(index - (row - 1))
+        )
+        for index in candidates:
+            free = full & ~masks[index]
+            if free:
+                bit = _nearest_bit(free, seats_in_row - seat)
+                masks[index] |= 1 << bit
+                suggestions.append((index + 1, seats_in_row - bit))
+                break
+    return suggestions
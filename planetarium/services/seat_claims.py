@@ -0,0 +1,289 @@
+"""Fast rejection of competing bookings before they reach the database.
+
+Every show session gets a bitmap in Redis with one bit per seat, laid out
+like the seat map. A booking claims its seats with a single atomic script
+and only goes on to insert tickets when none of the bits were set, so the
+losers of a race for the same seat are turned away without a transaction.
+
+The database stays the source of truth: a bitmap is built from the Ticket
+table on first use, dropped whenever tickets are changed or deleted, and
+can be rebuilt at any time with ``reconcile_seat_claims``. Seats under an
+active hold are claimed as well.
+
+Every claim records when it was made. A claim older than CLAIM_LEASE that
+no ticket or active hold backs was left by a crashed worker or an expired
+hold, and bookings drop it. Younger claims may belong to a booking still
+in flight and are never second-guessed.
+"""
+import logging
+import threading
+import time
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import transaction
+from redis.exceptions import RedisError
+
+from planetarium.services.seat_map import (
+    held_seats,
+    pack_seats,
+    seat_index,
+    taken_seats,
+)
+
+logger = logging.getLogger(__name__)
+
+SEAT_CLAIMS_KEY = "seat_claims:{show_session_id}"
+CLAIMED_AT_KEY = "seat_claims_at:{show_session_id}"
+SEAT_CLAIMS_TIMEOUT = 60 * 60 * 24
+# Longer than any booking transaction, retries included
+CLAIM_LEASE = 30
+
+# KEYS are the bitmap and the hash of claim times, ARGV the time of the
+# claim followed by the offsets. Returns -1 when the bitmap has not been
+# built yet, otherwise the list of offsets that are already claimed. Seats
+# are only claimed when that list is empty, so a booking never holds part
+# of its seats.
+CLAIM_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return -1
+end
+local taken = {}
+for i = 2, #ARGV do
+    if redis.call("GETBIT", KEYS[1], ARGV[i]) == 1 then
+        table.insert(taken, tonumber(ARGV[i]))
+    end
+end
+if #taken == 0 then
+    for i = 2, #ARGV do
+        redis.call("SETBIT", KEYS[1], ARGV[i], 1)
+        redis.call("HSET", KEYS[2], ARGV[i], ARGV[1])
+    end
+    local ttl = redis.call("TTL", KEYS[1])
+    if ttl > 0 then
+        redis.call("EXPIRE", KEYS[2], ttl)
+    end
+end
+return taken
+"""
+
+RELEASE_SCRIPT = """
+for i, offset in ipairs(ARGV) do
+    redis.call("SETBIT", KEYS[1], offset, 0)
+    redis.call("HDEL", KEYS[2], offset)
+end
+return 1
+"""
+
+
+class RedisSeatClaims:
+    def __init__(self, redis_cache):
+        self.cache = redis_cache
+
+    def _client(self, key):
+        # The resilient cache refuses while its circuit breaker is open
+        get_client = getattr(
+            self.cache, "get_client", self.cache._cache.get_client
+        )
+        return get_client(key, write=True)
+
+    def _keys(self, show_session_id):
+        return [
+            self.cache.make_key(key.format(show_session_id=show_session_id))
+            for key in (SEAT_CLAIMS_KEY, CLAIMED_AT_KEY)
+        ]
+
+    def claim(self, show_session_id, offsets, initial):
+        keys = self._keys(show_session_id)
+        client = self._client(keys[0])
+        taken = client.eval(CLAIM_SCRIPT, 2, *keys, time.time(), *offsets)
+        if taken == -1:
+            client.set(keys[0], initial(), ex=SEAT_CLAIMS_TIMEOUT, nx=True)
+            taken = client.eval(
+                CLAIM_SCRIPT, 2, *keys, time.time(), *offsets
+            )
+        return [int(offset) for offset in taken]
+
+    def claimed_at(self, show_session_id, offsets):
+        keys = self._keys(show_session_id)
+        values = self._client(keys[0]).hmget(keys[1], offsets)
+        return [float(value or 0) for value in values]
+
+    def renew(self, show_session_id, offsets):
+        keys = self._keys(show_session_id)
+        now = time.time()
+        self._client(keys[0]).hset(
+            keys[1], mapping={offset: now for offset in offsets}
+        )
+
+    def release(self, show_session_id, offsets):
+        keys = self._keys(show_session_id)
+        self._client(keys[0]).eval(RELEASE_SCRIPT, 2, *keys, *offsets)
+
+    def reset(self, show_session_id, bitmap=None):
+        keys = self._keys(show_session_id)
+        client = self._client(keys[0])
+        if bitmap is None:
+            client.delete(*keys)
+        else:
+            client.set(keys[0], bitmap, ex=SEAT_CLAIMS_TIMEOUT)
+            client.delete(keys[1])
+
+
+class LocalSeatClaims:
+    """Per-process claims for cache backends without Redis scripting"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bitmaps = {}
+        self.claimed_at_times = {}
+
+    def claim(self, show_session_id, offsets, initial):
+        with self.lock:
+            if show_session_id not in self.bitmaps:
+                self.bitmaps[show_session_id] = bytearray(initial())
+            bitmap = self.bitmaps[show_session_id]
+            taken = [
+                offset for offset in offsets
+                if bitmap[offset // 8] & (0x80 >> (offset % 8))
+            ]
+            if not taken:
+                times = self.claimed_at_times.setdefault(show_session_id, {})
+                now = time.time()
+                for offset in offsets:
+                    bitmap[offset // 8] |= 0x80 >> (offset % 8)
+                    times[offset] = now
+            return taken
+
+    def claimed_at(self, show_session_id, offsets):
+        with self.lock:
+            times = self.claimed_at_times.get(show_session_id, {})
+            return [times.get(offset, 0) for offset in offsets]
+
+    def renew(self, show_session_id, offsets):
+        with self.lock:
+            times = self.claimed_at_times.setdefault(show_session_id, {})
+            now = time.time()
+            for offset in offsets:
+                times[offset] = now
+
+    def release(self, show_session_id, offsets):
+        with self.lock:
+            bitmap = self.bitmaps.get(show_session_id)
+            times = self.claimed_at_times.get(show_session_id, {})
+            if bitmap is not None:
+                for offset in offsets:
+                    bitmap[offset // 8] &= ~(0x80 >> (offset % 8))
+                    times.pop(offset, None)
+
+    def reset(self, show_session_id, bitmap=None):
+        with self.lock:
+            self.claimed_at_times.pop(show_session_id, None)
+            if bitmap is None:
+                self.bitmaps.pop(show_session_id, None)
+            else:
+                self.bitmaps[show_session_id] = bytearray(bitmap)
+
+
+_local_claims = LocalSeatClaims()
+
+
+def get_seat_claims():
+    # The backend itself, django.core.cache.cache is a proxy that is never
+    # a RedisCache
+    backend = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(backend, RedisCache):
+        return RedisSeatClaims(backend)
+    return _local_claims
+
+
+def _occupied_bitmap(show_session):
+    planetarium_dome = show_session.planetarium_dome
+    return pack_seats(
+        taken_seats(show_session) + held_seats(show_session),
+        planetarium_dome.rows,
+        planetarium_dome.seats_in_row,
+    )
+
+
+def _offsets(show_session, seats):
+    seats_in_row = show_session.planetarium_dome.seats_in_row
+    return [seat_index(row, seat, seats_in_row) for row, seat in seats]
+
+
+def claim_seats(show_session, seats):
+    """Atomically claim (row, seat) pairs of a session.
+
+    Returns the pairs that are already claimed, in which case nothing is
+    claimed. When the claim store is unreachable the booking is let through
+    and the database decides.
+    """
+    seats_in_row = show_session.planetarium_dome.seats_in_row
+    offsets = _offsets(show_session, seats)
+    try:
+        taken = get_seat_claims().claim(
+            show_session.id, offsets, lambda: _occupied_bitmap(show_session)
+        )
+    except RedisError:
+        logger.warning("Seat claims are unavailable", exc_info=True)
+        return []
+    return [
+        (offset // seats_in_row + 1, offset % seats_in_row + 1)
+        for offset in taken
+    ]
+
+
+def expired_claims(show_session, seats, lease=CLAIM_LEASE):
+    """The claimed seats among ``seats`` that were claimed more than lease
+    seconds ago, or that come from the bitmap built from the database"""
+    try:
+        claimed_at = get_seat_claims().claimed_at(
+            show_session.id, _offsets(show_session, seats)
+        )
+    except RedisError:
+        logger.warning("Seat claims are unavailable", exc_info=True)
+        return []
+    expired_before = time.time() - lease
+    return [
+        seat
+        for seat, claimed in zip(seats, claimed_at)
+        if claimed < expired_before
+    ]
+
+
+def renew_claims(show_session, seats):
+    """Restart the lease of claims the database was found to back"""
+    try:
+        get_seat_claims().renew(
+            show_session.id, _offsets(show_session, seats)
+        )
+    except RedisError:
+        logger.warning("Seat claims are unavailable", exc_info=True)
+
+
+def release_seats(show_session, seats):
+    """Give back claimed seats whose tickets or holds were not created, or
+    are gone"""
+    try:
+        get_seat_claims().release(
+            show_session.id, _offsets(show_session, seats)
+        )
+    except RedisError:
+        logger.warning("Seat claims are unavailable", exc_info=True)
+
+
+def reconcile_seat_claims(show_session):
+    """Rebuild the claims bitmap of a session from the Ticket table"""
+    get_seat_claims().reset(show_session.id, _occupied_bitmap(show_session))
+
+
+def invalidate_seat_claims(show_session_id):
+    """Drop the bitmap now and after commit so the next claim rebuilds it"""
+    def reset():
+        try:
+            get_seat_claims().reset(show_session_id)
+        except RedisError:
+            logger.warning("Seat claims are unavailable", exc_info=True)
+
+    reset()
+    transaction.on_commit(reset)
@@ -0,0 +1,81 @@
+import base64
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from planetarium.models import SeatHold, Ticket
+
+SEAT_MAP_CACHE_KEY = "seat_map:{show_session_id}"
+SEAT_MAP_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def seat_index(row, seat, seats_in_row):
+    """Position of a seat in the row-major bitmap of the dome"""
+    return (row - 1) * seats_in_row + (seat - 1)
+
+
+def pack_seats(seats, rows, seats_in_row):
+    """Pack (row, seat) pairs into a row-major bitmap, one bit per seat"""
+    bitmap = bytearray((rows * seats_in_row + 7) // 8)
+    for row, seat in seats:
+        index = seat_index(row, seat, seats_in_row)
+        bitmap[index // 8] |= 0x80 >> (index % 8)
+    return bytes(bitmap)
+
+
+# Maps and claims are cached until the next change of the session, so they
+# are built from the primary even for requests that read from a replica
+
+
+def taken_seats(show_session):
+    return list(
+        Ticket.objects.using(DEFAULT_DB_ALIAS).filter(
+            show_session=show_session
+        ).values_list("row", "seat")
+    )
+
+
+def held_seats(show_session):
+    return list(
+        SeatHold.objects.using(DEFAULT_DB_ALIAS).filter(
+            show_session=show_session, expires_at__gt=timezone.now()
+        ).values_list("row", "seat")
+    )
+
+
+def build_seat_map(show_session):
+    """Occupancy of a session, where both sold and held seats are set"""
+    planetarium_dome = show_session.planetarium_dome
+    taken = taken_seats(show_session)
+    held = held_seats(show_session)
+    bitmap = pack_seats(
+        taken + held, planetarium_dome.rows, planetarium_dome.seats_in_row
+    )
+    return {
+        "show_session": show_session.id,
+        "rows": planetarium_dome.rows,
+        "seats_in_row": planetarium_dome.seats_in_row,
+        "taken": len(taken),
+        "held": len(held),
+        "encoding": "bitmap",
+        "bitmap": base64.b64encode(bitmap).decode(),
+    }
+
+
+def get_seat_map(show_session):
+    """Return the cached occupancy of a show session, building it on miss"""
+    key = SEAT_MAP_CACHE_KEY.format(show_session_id=show_session.id)
+    seat_map = cache.get(key)
+    if seat_map is None:
+        seat_map = build_seat_map(show_session)
+        cache.set(key, seat_map, SEAT_MAP_CACHE_TIMEOUT)
+    return seat_map
+
+
+def invalidate_seat_map(show_session_id):
+    """Drop the cached map now and once more when the transaction commits,
+    so a map rebuilt from not yet committed data does not survive"""
+    key = SEAT_MAP_CACHE_KEY.format(show_session_id=show_session_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
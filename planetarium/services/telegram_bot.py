@@ -1,4 +1,5 @@
 import requests
+from requests.adapters import HTTPAdapter
 
 from planetarium_service import settings
 
@@ -6,7 +7,52 @@ TELEGRAM_TOKEN = settings.TELEGRAM_BOT_TOKEN
 CHAT_ID = settings.TELEGRAM_CHAT_ID
 
 
-def send_telegram_message(message):
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-    payload = {"chat_id": CHAT_ID, "text": message}
-    requests.post(url, data=payload)
+class TransportError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TelegramTransport:
+    """Sends messages to the ops chat over one pooled HTTP session"""
+
+    def __init__(self, token=None, chat_id=None, timeout=None):
+        self.url = (
+            f"https://api.telegram.org/bot{token or TELEGRAM_TOKEN}"
+            f"/sendMessage"
+        )
+        self.chat_id = chat_id or CHAT_ID
+        self.timeout = timeout or settings.TELEGRAM_TIMEOUT
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=4))
+
+    def send(self, message):
+        payload = {"chat_id": self.chat_id, "text": message}
+        try:
+            response = self.session.post(
+                self.url, data=payload, timeout=self.timeout
+            )
+        except requests.RequestException as error:
+            raise TransportError(str(error)) from error
+
+        if response.status_code == 429:
+            retry_after = response.json().get("parameters", {}).get(
+                "retry_after"
+            )
+            raise TransportError(response.text, retry_after=retry_after)
+        if not response.ok:
+            raise TransportError(f"{response.status_code}: {response.text}")
+
+
+class StubTransport:
+    """Keeps messages in memory instead of sending them, for tests"""
+
+    def __init__(self, fail=0):
+        self.sent = []
+        self.fail = fail
+
+    def send(self, message):
+        if self.fail:
+            self.fail -= 1
+            raise TransportError("Stub transport failure")
+        self.sent.append(message)
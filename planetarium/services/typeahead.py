@@ -0,0 +1,120 @@
+"""Typeahead over show titles and theme names without a database query.
+
+Every process keeps a sorted array of the normalized titles and names,
+one entry for each word a title can be completed from, and answers a
+prefix with a bisect. The array is loaded on first use, patched by the
+model signals of this process and reloaded every REBUILD_INTERVAL to pick
+up changes made by other processes.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+
+from planetarium.models import AstronomyShow, ShowTheme
+
+REBUILD_INTERVAL = 60
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+ASTRONOMY_SHOW = "astronomy_show"
+SHOW_THEME = "show_theme"
+
+
+def normalize(text):
+    return " ".join(text.casefold().split())
+
+
+def completion_keys(label):
+    """The label from the start of every word, so "Black Holes" is found
+    by "bla" and by "hol" """
+    words = normalize(label).split(" ")
+    return {" ".join(words[index:]) for index in range(len(words))}
+
+
+class TypeaheadIndex:
+    def __init__(self, rebuild_interval=REBUILD_INTERVAL):
+        self.rebuild_interval = rebuild_interval
+        self.lock = threading.Lock()
+        self.keys = []
+        self.labels = {}
+        self.built_at = None
+
+    def load(self):
+        entries = [
+            (ASTRONOMY_SHOW, pk, title)
+            for pk, title in AstronomyShow.objects.values_list("id", "title")
+        ] + [
+            (SHOW_THEME, pk, name)
+            for pk, name in ShowTheme.objects.values_list("id", "name")
+        ]
+        keys = sorted(
+            (key, kind, pk)
+            for kind, pk, label in entries
+            for key in completion_keys(label)
+        )
+        labels = {(kind, pk): label for kind, pk, label in entries}
+        with self.lock:
+            self.keys, self.labels = keys, labels
+            self.built_at = time.monotonic()
+
+    def ensure_loaded(self):
+        if (
+            self.built_at is None
+            or time.monotonic() - self.built_at > self.rebuild_interval
+        ):
+            self.load()
+
+    def _remove(self, kind, pk):
+        label = self.labels.pop((kind, pk), None)
+        if label is None:
+            return
+        for key in completion_keys(label):
+            index = bisect_left(self.keys, (key, kind, pk))
+            if index < len(self.keys) and self.keys[index] == (key, kind, pk):
+                del self.keys[index]
+
+    def update(self, kind, pk, label):
+        """Replace the entry of an object, a no-op until the index is
+        loaded"""
+        with self.lock:
+            if self.built_at is None:
+                return
+            self._remove(kind, pk)
+            self.labels[kind, pk] = label
+            for key in completion_keys(label):
+                insort(self.keys, (key, kind, pk))
+
+    def remove(self, kind, pk):
+        with self.lock:
+            self._remove(kind, pk)
+
+    def complete(self, prefix, limit=DEFAULT_LIMIT):
+        """Up to limit objects with a word starting with prefix, as dicts
+        of type, id and label in alphabetical order"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        self.ensure_loaded()
+
+        results = []
+        seen = set()
+        with self.lock:
+            index = bisect_left(self.keys, (prefix,))
+            while index < len(self.keys) and len(results) < limit:
+                key, kind, pk = self.keys[index]
+                if not key.startswith(prefix):
+                    break
+                if (kind, pk) not in seen:
+                    seen.add((kind, pk))
+                    results.append(
+                        {
+                            "type": kind,
+                            "id": pk,
+                            "label": self.labels[kind, pk],
+                        }
+                    )
+                index += 1
+        return results
+
+
+typeahead_index = TypeaheadIndex()
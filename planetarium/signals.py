@@ -0,0 +1,125 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from planetarium.cache import invalidate
+from planetarium.models import (
+    AstronomyShow,
+    PlanetariumDome,
+    Reservation,
+    ShowSession,
+    ShowTheme,
+    Ticket,
+)
+from planetarium.services.seat_claims import invalidate_seat_claims
+from planetarium.services.seat_map import invalidate_seat_map
+from planetarium.services.typeahead import (
+    ASTRONOMY_SHOW,
+    SHOW_THEME,
+    typeahead_index,
+)
+
+
+def _count_sold(show_session_id, count):
+    ShowSession.objects.filter(id=show_session_id).update(
+        tickets_sold=F("tickets_sold") + count, updated_at=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Ticket)
+def ticket_saved(sender, instance, created, **kwargs):
+    loaded_show_session_id = getattr(
+        instance, "_loaded_show_session_id", None
+    )
+    if created:
+        _count_sold(instance.show_session_id, 1)
+    elif loaded_show_session_id not in (None, instance.show_session_id):
+        _count_sold(loaded_show_session_id, -1)
+        _count_sold(instance.show_session_id, 1)
+        invalidate_seat_map(loaded_show_session_id)
+        invalidate_seat_claims(loaded_show_session_id)
+    instance._loaded_show_session_id = instance.show_session_id
+
+
+@receiver(post_delete, sender=Ticket)
+def ticket_deleted(sender, instance, **kwargs):
+    _count_sold(instance.show_session_id, -1)
+
+
+@receiver([post_save, post_delete], sender=Ticket)
+def ticket_changed(sender, instance, created=False, **kwargs):
+    invalidate_seat_map(instance.show_session_id)
+    if not created:
+        invalidate_seat_claims(instance.show_session_id)
+
+
+def _reservation_user_id(ticket):
+    if Ticket.reservation.is_cached(ticket):
+        return ticket.reservation.user_id
+    return Reservation.objects.filter(
+        id=ticket.reservation_id
+    ).values_list("user_id", flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Ticket)
+def user_tickets_changed(sender, instance, **kwargs):
+    invalidate(f"reservations:{_reservation_user_id(instance)}")
+
+
+@receiver([post_save, post_delete], sender=Reservation)
+def reservation_changed(sender, instance, **kwargs):
+    invalidate(f"reservations:{instance.user_id}")
+
+
+@receiver([post_save, post_delete], sender=ShowSession)
+def show_session_changed(sender, instance, **kwargs):
+    invalidate_seat_map(instance.id)
+    invalidate_seat_claims(instance.id)
+    invalidate("show_sessions")
+
+
+@receiver([post_save, post_delete], sender=ShowTheme)
+def show_theme_changed(sender, instance, **kwargs):
+    invalidate("show_themes")
+
+
+@receiver([post_save, post_delete], sender=AstronomyShow)
+def astronomy_show_changed(sender, instance, **kwargs):
+    invalidate("astronomy_shows")
+
+
+# The index is shared by the requests of the process, so it only gets
+# committed changes
+def _update_typeahead(kind, pk, label):
+    transaction.on_commit(lambda: typeahead_index.update(kind, pk, label))
+
+
+def _remove_from_typeahead(kind, pk):
+    transaction.on_commit(lambda: typeahead_index.remove(kind, pk))
+
+
+@receiver(post_save, sender=AstronomyShow)
+def astronomy_show_saved(sender, instance, **kwargs):
+    _update_typeahead(ASTRONOMY_SHOW, instance.id, instance.title)
+
+
+@receiver(post_delete, sender=AstronomyShow)
+def astronomy_show_deleted(sender, instance, **kwargs):
+    _remove_from_typeahead(ASTRONOMY_SHOW, instance.id)
+
+
+@receiver(post_save, sender=ShowTheme)
+def show_theme_saved(sender, instance, **kwargs):
+    _update_typeahead(SHOW_THEME, instance.id, instance.name)
+
+
+@receiver(post_delete, sender=ShowTheme)
+def show_theme_deleted(sender, instance, **kwargs):
+    _remove_from_typeahead(SHOW_THEME, instance.id)
+
+
+@receiver([post_save, post_delete], sender=PlanetariumDome)
+def planetarium_dome_changed(sender, instance, **kwargs):
+    invalidate("planetarium_domes")
@@ -0,0 +1,140 @@
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from planetarium.cache_backends import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LocalLRU,
+    ResilientRedisCache,
+    TwoTierCache,
+)
+
+
+class LocalLRUTests(SimpleTestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        lru = LocalLRU(max_entries=2)
+        lru.set("a", 1, 60)
+        lru.set("b", 2, 60)
+        lru.get("a")
+        lru.set("c", 3, 60)
+        self.assertEqual(lru.get("a"), 1)
+        self.assertEqual(lru.get("c"), 3)
+        self.assertEqual(len(lru), 2)
+        lru.get("b")
+        self.assertEqual(lru.misses, 1)
+
+    def test_expired_entry_is_a_miss(self):
+        lru = LocalLRU(max_entries=2)
+        lru.set("a", 1, 0.01)
+        time.sleep(0.02)
+        lru.get("a")
+        self.assertEqual((lru.hits, lru.misses, len(lru)), (0, 1, 0))
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = TwoTierCache(
+            "default",
+            {"OPTIONS": {"MAX_ENTRIES": 10, "CHANNEL": self.id()}},
+        )
+        cache.clear()
+        self.cache.clear()
+
+    def test_repeated_reads_are_served_locally(self):
+        cache.set("theme", "Stars")
+        self.assertEqual(self.cache.get("theme"), "Stars")
+        self.assertEqual(self.cache.get_many(["theme"]), {"theme": "Stars"})
+        self.assertEqual(self.cache.get("other", "missing"), "missing")
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["local.hits"], 1)
+        self.assertEqual(stats["remote.hits"], 1)
+        self.assertEqual(stats["remote.misses"], 1)
+
+    def test_local_copies_are_not_shared(self):
+        self.cache.set("themes", ["Stars"])
+        self.cache.get("themes").append("Planets")
+        self.assertEqual(self.cache.get("themes"), ["Stars"])
+
+    def test_writes_evict_the_local_copy(self):
+        self.cache.set("version", 1)
+        self.cache.get("version")
+        self.cache.incr("version")
+        self.assertEqual(self.cache.get("version"), 2)
+        self.cache.delete("version")
+        self.assertIsNone(self.cache.get("version"))
+
+    def test_invalidation_message_evicts_the_local_copy(self):
+        self.cache.set("theme", "Stars")
+        cache.set("theme", "Planets")
+        self.assertEqual(self.cache.get("theme"), "Stars")
+        # What the pub/sub listener does for a write of another worker
+        self.cache._tier.evict([cache.make_key("theme")])
+        self.assertEqual(self.cache.get("theme"), "Planets")
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_breaker_opens_and_lets_one_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.01)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.02)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        self.assertTrue(breaker.record_success())
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_trial_opens_the_breaker_again(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        breaker.allow()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+
+class ResilientRedisCacheTests(SimpleTestCase):
+    def setUp(self):
+        # Nothing listens on port 1, connections are refused at once
+        self.cache = ResilientRedisCache(
+            f"redis://127.0.0.1:1/{self.id()}",
+            {"OPTIONS": {"FAILURE_THRESHOLD": 2, "RESET_TIMEOUT": 60}},
+        )
+
+    def test_dead_redis_falls_back_to_local_memory(self):
+        with self.assertLogs("planetarium.cache_backends", "WARNING"):
+            self.assertIsNone(self.cache.get("theme"))
+            self.cache.set("theme", "Stars")
+        self.assertEqual(self.cache.get("theme"), "Stars")
+        self.assertEqual(self.cache.stats()["breaker.state"], "open")
+        self.assertFalse(self.cache.available)
+        self.assertEqual(self.cache.stats()["fallback.written"], 1)
+
+    def test_fallback_entries_expire_early(self):
+        cache = ResilientRedisCache(
+            f"redis://127.0.0.1:1/{self.id()}/short",
+            {"OPTIONS": {"FAILURE_THRESHOLD": 1, "FALLBACK_TIMEOUT": 0.05}},
+        )
+        with self.assertLogs("planetarium.cache_backends", "WARNING"):
+            cache.set("page", "Stars", 60 * 60 * 24)
+        cache.add("version", 1, None)
+        self.assertEqual(cache.get("page"), "Stars")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("page"))
+        self.assertIsNone(cache.get("version"))
+
+    def test_open_breaker_skips_redis(self):
+        with self.assertLogs("planetarium.cache_backends", "WARNING"):
+            self.cache.get("theme")
+            self.cache.get("theme")
+        started = time.monotonic()
+        for _ in range(100):
+            self.cache.get("theme")
+        self.assertLess(time.monotonic() - started, 0.1)
+        with self.assertRaises(CircuitOpenError):
+            self.cache.get_client("theme")
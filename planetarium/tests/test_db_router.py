@@ -0,0 +1,116 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import OperationalError, connections
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from planetarium import db_router
+from planetarium.cache import bump_version
+from planetarium.services.seat_map import build_seat_map
+from planetarium.models import (
+    AstronomyShow,
+    PlanetariumDome,
+    ShowSession,
+    ShowTheme,
+)
+from planetarium_service import settings
+
+User = get_user_model()
+TICKETS_URL = reverse("planetarium:ticket-list")
+SHOW_THEME_URL = reverse("planetarium:show_theme-list")
+
+
+@mock.patch.object(settings, "DATABASE_REPLICAS", ["default"])
+class ReplicaRoutingTests(APITestCase):
+    def setUp(self):
+        db_router._breakers.clear()
+        self.user = User.objects.create_user(
+            email="reader@tt.com", password="password123"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.show_session = ShowSession.objects.create(
+            astronomy_show=AstronomyShow.objects.create(title="Nebulae"),
+            planetarium_dome=PlanetariumDome.objects.create(
+                name="Dome 1", rows=10, seats_in_row=20
+            ),
+            show_time="2024-08-08 15:00",
+        )
+
+    def tearDown(self):
+        cache.delete(db_router.PIN_KEY.format(user_id=self.user.pk))
+
+    def test_unreachable_replica_falls_back_to_primary(self):
+        self.assertEqual(db_router.choose_replica(), "default")
+
+        with mock.patch.object(
+            connections["default"],
+            "ensure_connection",
+            side_effect=OperationalError,
+        ) as ensure_connection:
+            self.assertIsNone(db_router.choose_replica())
+            self.assertIsNone(db_router.choose_replica())
+        # The open breaker keeps the replica out without trying it again
+        self.assertEqual(ensure_connection.call_count, 1)
+
+    def test_safe_requests_read_from_replica(self):
+        with mock.patch.object(
+            db_router, "choose_replica", return_value="default"
+        ) as choose_replica:
+            response = self.client.get(TICKETS_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        choose_replica.assert_called_once()
+        self.assertIsNone(db_router.ReplicaRouter().db_for_read(User))
+
+    def test_user_reads_from_primary_after_writing(self):
+        response = self.client.post(
+            TICKETS_URL,
+            {"row": 1, "seat": 1, "show_session": self.show_session.id},
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(db_router.is_pinned(self.user.pk))
+
+        with mock.patch.object(db_router, "choose_replica") as choose_replica:
+            response = self.client.get(TICKETS_URL)
+        self.assertEqual(len(response.data["results"]), 1)
+        choose_replica.assert_not_called()
+
+    def test_failed_writes_do_not_pin(self):
+        self.client.post(TICKETS_URL, {"row": 99, "seat": 1})
+        self.assertFalse(db_router.is_pinned(self.user.pk))
+
+    def test_replica_reads_are_not_cached_for_the_primary(self):
+        theme = ShowTheme.objects.create(name="Comets")
+        # A write bumps the versions before the replica has caught up, so
+        # the replica still holds the old row under the new versions
+        bump_version("show_themes")
+        with mock.patch.object(
+            db_router, "choose_replica", return_value="default"
+        ):
+            response = self.client.get(SHOW_THEME_URL)
+        self.assertEqual(response.data["results"][0]["name"], "Comets")
+
+        ShowTheme.objects.filter(pk=theme.pk).update(name="Meteors")
+        db_router.pin_to_primary(self.user.pk)
+        response = self.client.get(SHOW_THEME_URL)
+        self.assertEqual(response.data["results"][0]["name"], "Meteors")
+
+    def test_cached_responses_do_not_connect_to_replica(self):
+        self.client.get(SHOW_THEME_URL)
+        with mock.patch.object(db_router, "choose_replica") as choose_replica:
+            response = self.client.get(SHOW_THEME_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        choose_replica.assert_not_called()
+
+    @mock.patch.object(
+        db_router, "choose_replica", return_value="lagging_replica"
+    )
+    def test_seat_map_is_built_from_the_primary(self, choose_replica):
+        token = db_router._read_alias.set(db_router.ReplicaRead())
+        try:
+            seat_map = build_seat_map(self.show_session)
+        finally:
+            db_router._read_alias.reset(token)
+        self.assertEqual(seat_map["taken"], 0)
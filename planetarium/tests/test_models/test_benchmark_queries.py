@@ -0,0 +1,32 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from planetarium.models import ShowSession, Ticket
+
+
+class BenchmarkQueriesCommandTests(TestCase):
+    def test_reports_plans_with_and_without_indexes(self):
+        out = StringIO()
+        call_command(
+            "benchmark_queries",
+            sessions=20,
+            users=2,
+            tickets_per_session=2,
+            repeat=1,
+            i_know_this_locks_tables=True,
+            stdout=out,
+        )
+        output = out.getvalue()
+        self.assertIn("without indexes", output)
+        self.assertIn("planetarium_show_ti_", output)
+        self.assertIn("user_tickets", output.split("Summary")[1])
+
+        self.assertFalse(ShowSession.objects.exists())
+        self.assertFalse(Ticket.objects.exists())
+
+    def test_refuses_default_database_without_consent(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_queries", sessions=1, stdout=StringIO())
+        self.assertFalse(ShowSession.objects.exists())
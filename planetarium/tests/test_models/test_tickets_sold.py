@@ -0,0 +1,120 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from planetarium.models import (
+    AstronomyShow,
+    PlanetariumDome,
+    Reservation,
+    ShowSession,
+    Ticket,
+)
+
+User = get_user_model()
+
+
+class TicketsSoldCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@tt.com", password="password123"
+        )
+        planetarium_dome = PlanetariumDome.objects.create(
+            name="Dome 2", rows=10, seats_in_row=20
+        )
+        astronomy_show = AstronomyShow.objects.create(title="Exoplanets")
+        self.show_session = ShowSession.objects.create(
+            astronomy_show=astronomy_show,
+            planetarium_dome=planetarium_dome,
+            show_time="2024-08-08 15:00",
+        )
+        self.other_session = ShowSession.objects.create(
+            astronomy_show=astronomy_show,
+            planetarium_dome=planetarium_dome,
+            show_time="2024-08-09 15:00",
+        )
+        self.reservation = Reservation.objects.create(user=self.user)
+
+    def tickets_sold(self, show_session):
+        show_session.refresh_from_db()
+        return show_session.tickets_sold
+
+    def test_counter_follows_created_and_deleted_tickets(self):
+        ticket = Ticket.objects.create(
+            row=1, seat=1,
+            show_session=self.show_session, reservation=self.reservation
+        )
+        self.assertEqual(self.tickets_sold(self.show_session), 1)
+        ticket.delete()
+        self.assertEqual(self.tickets_sold(self.show_session), 0)
+
+    def test_counter_follows_bulk_create_and_cascade_delete(self):
+        Ticket.objects.bulk_create(
+            Ticket(
+                row=1, seat=seat,
+                show_session=self.show_session, reservation=self.reservation
+            )
+            for seat in range(1, 4)
+        )
+        self.assertEqual(self.tickets_sold(self.show_session), 3)
+        self.reservation.delete()
+        self.assertEqual(self.tickets_sold(self.show_session), 0)
+
+    def test_bulk_create_rejects_conflict_handling(self):
+        Ticket.objects.create(
+            row=1, seat=1,
+            show_session=self.show_session, reservation=self.reservation
+        )
+        tickets = [
+            Ticket(
+                row=1, seat=seat,
+                show_session=self.show_session, reservation=self.reservation
+            )
+            for seat in range(1, 3)
+        ]
+        with self.assertRaises(ValueError):
+            Ticket.objects.bulk_create(tickets, ignore_conflicts=True)
+        with self.assertRaises(ValueError):
+            Ticket.objects.bulk_create(
+                tickets,
+                update_conflicts=True,
+                update_fields=["reservation"],
+                unique_fields=["show_session", "row", "seat"],
+            )
+        self.assertEqual(self.tickets_sold(self.show_session), 1)
+        self.assertEqual(Ticket.objects.count(), 1)
+
+    def test_counter_follows_ticket_moved_to_other_session(self):
+        Ticket.objects.create(
+            row=1, seat=1,
+            show_session=self.show_session, reservation=self.reservation
+        )
+        ticket = Ticket.objects.get()
+        ticket.show_session = self.other_session
+        ticket.save()
+        self.assertEqual(self.tickets_sold(self.show_session), 0)
+        self.assertEqual(self.tickets_sold(self.other_session), 1)
+
+    def test_saving_a_loaded_session_keeps_tickets_sold_meanwhile(self):
+        show_session = ShowSession.objects.get(id=self.show_session.id)
+        Ticket.objects.create(
+            row=1, seat=1,
+            show_session=self.show_session, reservation=self.reservation
+        )
+        show_session.save()
+        self.assertEqual(self.tickets_sold(self.show_session), 1)
+
+    def test_recount_command_checks_and_fixes_counters(self):
+        Ticket.objects.create(
+            row=1, seat=1,
+            show_session=self.show_session, reservation=self.reservation
+        )
+        ShowSession.objects.update(tickets_sold=7)
+
+        with self.assertRaises(CommandError):
+            call_command("recount_tickets_sold", "--check", stdout=StringIO())
+        call_command("recount_tickets_sold", stdout=StringIO())
+        self.assertEqual(self.tickets_sold(self.show_session), 1)
+        self.assertEqual(self.tickets_sold(self.other_session), 0)
+        call_command("recount_tickets_sold", "--check", stdout=StringIO())
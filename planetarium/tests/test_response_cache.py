@@ -0,0 +1,63 @@
+import time
+import uuid
+
+from django.test import SimpleTestCase
+from rest_framework.response import Response
+
+from planetarium.cache import REBUILD_LOCK_KEY, cache, get_or_build
+
+
+class GetOrBuildTests(SimpleTestCase):
+    def setUp(self):
+        self.key = f"page:{uuid.uuid4()}"
+        self.stale_key = f"stale:{self.key}"
+        self.builds = 0
+
+    def build(self):
+        self.builds += 1
+        return Response({"build": self.builds})
+
+    def entry(self, data, delta=0.01, expires_in=60):
+        return {
+            "data": data,
+            "delta": delta,
+            "expires_at": time.time() + expires_in,
+        }
+
+    def test_page_is_built_once(self):
+        get_or_build(self.key, self.stale_key, 60, self.build)
+        response = get_or_build(self.key, self.stale_key, 60, self.build)
+        self.assertEqual(response.data, {"build": 1})
+        self.assertEqual(self.builds, 1)
+
+    def test_stale_page_is_served_while_another_worker_rebuilds(self):
+        cache.set(self.stale_key, self.entry({"build": 0}))
+        cache.add(REBUILD_LOCK_KEY.format(key=self.key), True)
+        response = get_or_build(self.key, self.stale_key, 60, self.build)
+        self.assertEqual(response.data, {"build": 0})
+        self.assertEqual(self.builds, 0)
+
+    def test_page_is_refreshed_early_near_expiry(self):
+        cache.set(self.key, self.entry({"build": 0}, delta=60, expires_in=1))
+        response = get_or_build(self.key, self.stale_key, 60, self.build)
+        self.assertEqual(response.data, {"build": 1})
+        self.assertIsNone(cache.get(REBUILD_LOCK_KEY.format(key=self.key)))
+
+    def test_failed_responses_are_not_cached(self):
+        def build():
+            self.builds += 1
+            return Response(status=500)
+
+        get_or_build(self.key, self.stale_key, 60, build)
+        get_or_build(self.key, self.stale_key, 60, build)
+        self.assertEqual(self.builds, 2)
+
+    def test_response_can_shorten_its_timeout(self):
+        def build():
+            response = self.build()
+            response.cache_timeout = 5
+            return response
+
+        get_or_build(self.key, self.stale_key, 60, build)
+        entry = cache.get(self.key)
+        self.assertLess(entry["expires_at"], time.time() + 6)
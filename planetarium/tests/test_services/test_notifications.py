@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from planetarium.models import (
+    AstronomyShow,
+    Notification,
+    PlanetariumDome,
+    ShowSession,
+)
+from planetarium.services.notifications import send_pending_notifications
+from planetarium.services.telegram_bot import StubTransport
+from planetarium_service import settings
+
+
+class SendPendingNotificationsTests(TestCase):
+    def setUp(self):
+        self.first = Notification.objects.create(message="First")
+        self.second = Notification.objects.create(message="Second")
+
+    def test_pending_notifications_are_sent_in_order(self):
+        transport = StubTransport()
+        self.assertEqual(send_pending_notifications(transport), 2)
+        self.assertEqual(transport.sent, ["First", "Second"])
+        self.assertFalse(
+            Notification.objects.exclude(status=Notification.SENT).exists()
+        )
+        self.assertEqual(send_pending_notifications(transport), 0)
+
+    def test_failed_notification_is_retried_later(self):
+        transport = StubTransport(fail=1)
+        self.assertEqual(send_pending_notifications(transport), 1)
+
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, Notification.PENDING)
+        self.assertEqual(self.first.attempts, 1)
+        self.assertGreater(self.first.next_attempt_at, timezone.now())
+        self.assertEqual(send_pending_notifications(transport), 0)
+
+        Notification.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_pending_notifications(transport), 1)
+        self.assertEqual(transport.sent, ["Second", "First"])
+
+    def test_worker_dying_mid_batch_keeps_sent_messages_sent(self):
+        transport = StubTransport()
+        with mock.patch.object(
+            transport, "send", side_effect=[None, RuntimeError]
+        ):
+            with self.assertRaises(RuntimeError):
+                send_pending_notifications(transport)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, Notification.SENT)
+        # The rest of the batch waits for the lease of the dead worker
+        self.assertEqual(send_pending_notifications(transport), 0)
+
+        Notification.objects.filter(status=Notification.PENDING).update(
+            next_attempt_at=timezone.now()
+        )
+        self.assertEqual(send_pending_notifications(transport), 1)
+        self.assertEqual(transport.sent, ["Second"])
+
+    def test_notification_fails_after_max_attempts(self):
+        Notification.objects.filter(id=self.first.id).update(
+            attempts=settings.NOTIFICATIONS["MAX_ATTEMPTS"] - 1
+        )
+        send_pending_notifications(StubTransport(fail=1))
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, Notification.FAILED)
+
+
+class SendDigestsTests(TestCase):
+    def setUp(self):
+        self.show_session = ShowSession.objects.create(
+            astronomy_show=AstronomyShow.objects.create(title="Black Holes"),
+            planetarium_dome=PlanetariumDome.objects.create(
+                name="Dome 4", rows=10, seats_in_row=16
+            ),
+            show_time=timezone.make_aware(datetime(2024, 8, 8, 19, 0)),
+        )
+        ShowSession.objects.filter(id=self.show_session.id).update(
+            tickets_sold=42
+        )
+        for tickets in (2, 40):
+            Notification.objects.create(
+                message="Booking",
+                show_session=self.show_session,
+                tickets=tickets,
+            )
+
+    def test_bookings_of_session_are_sent_as_one_message(self):
+        Notification.objects.update(
+            created_at=timezone.now() - timedelta(minutes=5)
+        )
+        transport = StubTransport()
+        self.assertEqual(
+            send_pending_notifications(transport, mode="digest"), 2
+        )
+        self.assertEqual(
+            transport.sent,
+            ["Black Holes 2024-08-08 19:00 — 42 new tickets, 118 left"],
+        )
+        self.assertFalse(
+            Notification.objects.exclude(status=Notification.SENT).exists()
+        )
+
+    def test_digest_waits_for_flush_interval_or_size(self):
+        transport = StubTransport()
+        self.assertEqual(
+            send_pending_notifications(transport, mode="digest"), 0
+        )
+        Notification.objects.create(
+            message="Booking", show_session=self.show_session, tickets=10
+        )
+        self.assertEqual(
+            send_pending_notifications(transport, mode="digest"), 3
+        )
+
+    @mock.patch.dict(settings.NOTIFICATIONS, {"BACKLOG_LIMIT": 1})
+    def test_single_mode_coalesces_when_backlog_grows(self):
+        Notification.objects.update(
+            created_at=timezone.now() - timedelta(minutes=5)
+        )
+        transport = StubTransport()
+        self.assertEqual(send_pending_notifications(transport), 2)
+        self.assertEqual(len(transport.sent), 1)
@@ -0,0 +1,52 @@
+import base64
+
+from django.test import SimpleTestCase
+
+from planetarium.services.seat_allocation import allocate_seats
+from planetarium.services.seat_map import pack_seats
+
+
+def seat_map(rows, seats_in_row, occupied=()):
+    return {
+        "rows": rows,
+        "seats_in_row": seats_in_row,
+        "bitmap": base64.b64encode(
+            pack_seats(occupied, rows, seats_in_row)
+        ).decode(),
+    }
+
+
+class SeatAllocationTests(SimpleTestCase):
+    def test_empty_dome_gets_centre_block(self):
+        self.assertEqual(
+            allocate_seats(seat_map(5, 10), 4),
+            [(3, 4), (3, 5), (3, 6), (3, 7)],
+        )
+
+    def test_taken_centre_moves_block_to_nearest_row(self):
+        self.assertEqual(
+            allocate_seats(seat_map(5, 10, [(3, 5), (3, 6)]), 2),
+            [(2, 5), (2, 6)],
+        )
+
+    def test_block_fits_into_the_only_gap(self):
+        occupied = [
+            (row, seat)
+            for row in range(1, 6)
+            for seat in range(1, 11)
+            if (row, seat) not in ((5, 8), (5, 9), (5, 10))
+        ]
+        self.assertEqual(
+            allocate_seats(seat_map(5, 10, occupied), 3),
+            [(5, 8), (5, 9), (5, 10)],
+        )
+        self.assertIsNone(allocate_seats(seat_map(5, 10, occupied), 4))
+
+    def test_excluded_seats_are_treated_as_occupied(self):
+        self.assertEqual(
+            allocate_seats(seat_map(1, 6), 2, exclude=[(1, 3)]),
+            [(1, 4), (1, 5)],
+        )
+
+    def test_party_larger_than_row_is_not_allocated(self):
+        self.assertIsNone(allocate_seats(seat_map(5, 10), 11))
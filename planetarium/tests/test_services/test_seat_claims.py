@@ -0,0 +1,109 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache.backends.redis import RedisCache
+from django.test import TestCase
+
+from planetarium.models import (
+    AstronomyShow,
+    PlanetariumDome,
+    Reservation,
+    ShowSession,
+    Ticket,
+)
+from planetarium.services import seat_claims
+from planetarium.services.booking import SeatsUnavailable, book_seats
+from planetarium.services.seat_claims import (
+    CLAIM_LEASE,
+    RedisSeatClaims,
+    claim_seats,
+    get_seat_claims,
+    reconcile_seat_claims,
+    release_seats,
+)
+
+User = get_user_model()
+
+
+class SeatClaimsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="testuser@tt.com", password="password123"
+        )
+        self.planetarium_dome = PlanetariumDome.objects.create(
+            name="Dome 5", rows=5, seats_in_row=10
+        )
+        self.show_session = ShowSession.objects.create(
+            astronomy_show=AstronomyShow.objects.create(title="Nebulae"),
+            planetarium_dome=self.planetarium_dome,
+            show_time="2024-08-08 15:00",
+        )
+        self.reservation = Reservation.objects.create(user=self.user)
+        Ticket.objects.create(
+            row=1, seat=1,
+            show_session=self.show_session, reservation=self.reservation
+        )
+
+    def test_claim_is_built_from_existing_tickets(self):
+        self.assertEqual(claim_seats(self.show_session, [(1, 1)]), [(1, 1)])
+        self.assertEqual(claim_seats(self.show_session, [(1, 2)]), [])
+
+    def test_conflicting_claim_claims_nothing(self):
+        self.assertEqual(claim_seats(self.show_session, [(2, 1)]), [])
+        self.assertEqual(
+            claim_seats(self.show_session, [(2, 2), (2, 1)]), [(2, 1)]
+        )
+        self.assertEqual(claim_seats(self.show_session, [(2, 2)]), [])
+
+    def test_released_seats_can_be_claimed_again(self):
+        claim_seats(self.show_session, [(3, 3)])
+        release_seats(self.show_session, [(3, 3)])
+        self.assertEqual(claim_seats(self.show_session, [(3, 3)]), [])
+
+    def test_reconcile_drops_claims_without_tickets(self):
+        claim_seats(self.show_session, [(4, 4)])
+        reconcile_seat_claims(self.show_session)
+        self.assertEqual(claim_seats(self.show_session, [(4, 4)]), [])
+        self.assertEqual(claim_seats(self.show_session, [(1, 1)]), [(1, 1)])
+
+    def test_claim_left_by_a_dead_booking_does_not_block_seats(self):
+        claim_seats(self.show_session, [(4, 4)])
+        later = mock.Mock(time=lambda: time.time() + CLAIM_LEASE + 1)
+        with mock.patch.object(seat_claims, "time", later):
+            reservation, tickets = book_seats(
+                self.user, self.show_session, [(4, 4)]
+            )
+        self.assertEqual(len(tickets), 1)
+
+    def test_claim_of_a_booking_in_flight_is_kept(self):
+        claim_seats(self.show_session, [(4, 5)])
+        with self.assertRaises(SeatsUnavailable):
+            book_seats(self.user, self.show_session, [(4, 5)])
+        self.assertEqual(
+            claim_seats(self.show_session, [(4, 5)]), [(4, 5)]
+        )
+
+    def test_lost_race_keeps_the_claim_of_the_sold_seat(self):
+        # The claim of the winner was lost, the loser gets to the database
+        release_seats(self.show_session, [(1, 1)])
+        with self.assertRaises(SeatsUnavailable):
+            book_seats(self.user, self.show_session, [(1, 1)])
+        self.assertEqual(claim_seats(self.show_session, [(1, 1)]), [(1, 1)])
+
+    def test_failed_booking_releases_its_claims(self):
+        with mock.patch(
+            "planetarium.services.booking.notify_booking",
+            side_effect=RuntimeError,
+        ):
+            with self.assertRaises(RuntimeError):
+                book_seats(self.user, self.show_session, [(5, 5)])
+        self.assertEqual(claim_seats(self.show_session, [(5, 5)]), [])
+
+    def test_redis_cache_gets_shared_claims(self):
+        redis_cache = RedisCache("redis://127.0.0.1:1", {})
+        with mock.patch(
+            "planetarium.services.seat_claims.caches",
+            {"default": redis_cache},
+        ):
+            self.assertIsInstance(get_seat_claims(), RedisSeatClaims)
@@ -0,0 +1,78 @@
+from django.db import DatabaseError, transaction
+from django.test import TestCase
+from django.urls import reverse
+
+from planetarium.models import AstronomyShow, ShowTheme
+from planetarium.services.typeahead import (
+    ASTRONOMY_SHOW,
+    SHOW_THEME,
+    TypeaheadIndex,
+    typeahead_index,
+)
+
+AUTOCOMPLETE_URL = reverse("planetarium:astronomy_show-autocomplete")
+
+
+class TypeaheadIndexTests(TestCase):
+    def setUp(self):
+        self.theme = ShowTheme.objects.create(name="Black Holes")
+        self.show = AstronomyShow.objects.create(
+            title="Blackbody Radiation", show_theme=self.theme
+        )
+        self.index = TypeaheadIndex()
+        self.index.load()
+
+    def labels(self, prefix, limit=10):
+        return [item["label"] for item in self.index.complete(prefix, limit)]
+
+    def test_completes_from_start_of_any_word(self):
+        self.assertEqual(
+            self.labels("BLACK"), ["Black Holes", "Blackbody Radiation"]
+        )
+        self.assertEqual(self.labels("hol"), ["Black Holes"])
+        self.assertEqual(self.labels("lack"), [])
+        self.assertEqual(self.labels(" "), [])
+
+    def test_limit_counts_objects_not_words(self):
+        self.index.update(ASTRONOMY_SHOW, 100, "Black Black Black")
+        self.assertEqual(len(self.index.complete("bla", 2)), 2)
+        self.assertEqual(len(self.index.complete("bla", 3)), 3)
+
+    def test_update_and_remove_replace_entries(self):
+        self.index.update(ASTRONOMY_SHOW, self.show.id, "Solar Wind")
+        self.assertEqual(self.labels("blackb"), [])
+        self.assertEqual(self.labels("wind"), ["Solar Wind"])
+
+        self.index.remove(SHOW_THEME, self.theme.id)
+        self.assertEqual(self.labels("bla"), [])
+
+    def test_endpoint_follows_saved_and_deleted_models(self):
+        typeahead_index.load()
+        with self.captureOnCommitCallbacks(execute=True):
+            comets = AstronomyShow.objects.create(
+                title="Comets", show_theme=self.theme
+            )
+        response = self.client.get(AUTOCOMPLETE_URL, {"q": "com"})
+        self.assertEqual(
+            response.data,
+            [{"type": ASTRONOMY_SHOW, "id": comets.id, "label": "Comets"}],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            comets.delete()
+        response = self.client.get(AUTOCOMPLETE_URL, {"q": "com"})
+        self.assertEqual(response.data, [])
+
+    def test_endpoint_ignores_rolled_back_changes(self):
+        typeahead_index.load()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    AstronomyShow.objects.create(
+                        title="Comets", show_theme=self.theme
+                    )
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        response = self.client.get(AUTOCOMPLETE_URL, {"q": "com"})
+        self.assertEqual(response.data, [])
@@ -62,3 +62,47 @@ class AstronomyShowViewSetTests(APITestCase):
         }
         response = self.client.post(self.astronomy_show_list_url, payload)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cached_list_follows_show_theme_rename(self):
+        self.client.get(self.astronomy_show_list_url)
+        self.show_theme.name = "Theme 2"
+        self.show_theme.save()
+
+        response = self.client.get(self.astronomy_show_list_url)
+        self.assertEqual(response.data["results"][0]["show_theme"], "Theme 2")
+
+    def test_retrieve_serves_cached_fragment_until_show_changes(self):
+        self.client.get(self.astronomy_show_detail_url)
+        AstronomyShow.objects.filter(id=self.astronomy_show.id).update(
+            description="Changed without signals"
+        )
+        response = self.client.get(self.astronomy_show_detail_url)
+        self.assertEqual(response.data["description"], "Description 1")
+
+        self.astronomy_show.description = "Changed"
+        self.astronomy_show.save()
+        response = self.client.get(self.astronomy_show_detail_url)
+        self.assertEqual(response.data["description"], "Changed")
+
+    def test_search_matches_title_and_description_words(self):
+        AstronomyShow.objects.create(
+            title="Black Holes",
+            description="A journey past the event horizon",
+            show_theme=self.show_theme,
+        )
+        AstronomyShow.objects.create(
+            title="Event Horizon Telescope",
+            description="Imaging a black hole",
+            show_theme=self.show_theme,
+        )
+
+        response = self.client.get(
+            self.astronomy_show_list_url, {"search": "horizon"}
+        )
+        self.assertEqual(len(response.data["results"]), 2)
+
+        response = self.client.get(
+            self.astronomy_show_list_url, {"search": "journey horizon"}
+        )
+        titles = [show["title"] for show in response.data["results"]]
+        self.assertEqual(titles, ["Black Holes"])
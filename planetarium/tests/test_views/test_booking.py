@@ -0,0 +1,102 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from planetarium.models import (
+    AstronomyShow,
+    Notification,
+    PlanetariumDome,
+    Reservation,
+    ShowSession,
+    Ticket,
+)
+
+User = get_user_model()
+BOOK_URL = reverse("planetarium:reservation-book")
+
+
+class ReservationBookingTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="testuser@tt.com", password="password123"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.astronomy_show = AstronomyShow.objects.create(title="Comets")
+        self.planetarium_dome = PlanetariumDome.objects.create(
+            name="Dome 7", rows=10, seats_in_row=20
+        )
+        self.show_session = ShowSession.objects.create(
+            astronomy_show=self.astronomy_show,
+            planetarium_dome=self.planetarium_dome,
+            show_time="2024-08-08 15:00",
+        )
+
+    def book(self, seats):
+        payload = {
+            "show_session": self.show_session.id,
+            "tickets": [{"row": row, "seat": seat} for row, seat in seats],
+        }
+        return self.client.post(BOOK_URL, payload, format="json")
+
+    def test_book_several_seats_in_one_reservation(self):
+        response = self.book([(3, 1), (3, 2), (3, 3)])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Reservation.objects.count(), 1)
+        reservation = Reservation.objects.get()
+        self.assertEqual(reservation.user, self.user)
+        self.assertEqual(
+            list(reservation.ticket_set.values_list("row", "seat")),
+            [(3, 1), (3, 2), (3, 3)],
+        )
+        self.assertEqual(len(response.data["tickets"]), 3)
+        self.assertIn(
+            "Seats: Row: 3, Seat: 1, Row: 3, Seat: 2, Row: 3, Seat: 3",
+            Notification.objects.get().message,
+        )
+
+    def test_booking_fails_as_a_whole_if_any_seat_is_taken(self):
+        self.book([(1, 5)])
+        response = self.book([(1, 4), (1, 5), (1, 6)])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["conflicts"], [{"row": 1, "seat": 5}])
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.assertEqual(Ticket.objects.count(), 1)
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_booking_validates_seats_against_dome(self):
+        response = self.book([(1, 1), (11, 1), (1, 21)])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(response.data["tickets"]), 2)
+        self.assertFalse(Ticket.objects.exists())
+
+    def test_booking_rejects_duplicate_seats(self):
+        response = self.book([(2, 2), (2, 2)])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_anonymous_user_cant_book(self):
+        response = APIClient().post(BOOK_URL, {}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_allocate_books_best_block_for_party(self):
+        self.book([(5, 9), (5, 10)])
+        url = reverse(
+            "planetarium:show_session-allocate", args=[self.show_session.id]
+        )
+        response = self.client.post(url, {"party_size": 3}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            [(ticket["row"], ticket["seat"])
+             for ticket in response.data["tickets"]],
+            [(6, 10), (6, 11), (6, 12)],
+        )
+
+    def test_allocate_fails_when_no_block_fits(self):
+        url = reverse(
+            "planetarium:show_session-allocate", args=[self.show_session.id]
+        )
+        response = self.client.post(url, {"party_size": 21}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Ticket.objects.exists())
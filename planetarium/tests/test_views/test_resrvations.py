@@ -26,6 +26,12 @@ class ReservationViewSetTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["results"], serializer.data)
 
+    def test_cached_reservation_list_is_refreshed_after_delete(self):
+        self.client.get(RESERVATION_URL)
+        self.reservation.delete()
+        response = self.client.get(RESERVATION_URL)
+        self.assertEqual(response.data["results"], [])
+
     def test_create_reservation_for_auth_users(self):
         response = self.client.post(RESERVATION_URL)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
@@ -0,0 +1,163 @@
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from redis.exceptions import RedisError
+from rest_framework import status
+from rest_framework.test import APIClient, APITestCase
+
+from planetarium.models import (
+    AstronomyShow,
+    PlanetariumDome,
+    SeatHold,
+    ShowSession,
+    Ticket,
+)
+from planetarium.services import seat_claims
+from planetarium.services.booking import (
+    SeatsUnavailable,
+    book_seats,
+    hold_seats,
+)
+from planetarium.services.seat_claims import CLAIM_LEASE, claim_seats
+
+User = get_user_model()
+SEAT_HOLDS_URL = reverse("planetarium:seat_hold-list")
+TICKETS_URL = reverse("planetarium:ticket-list")
+
+
+class SeatHoldViewSetTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="testuser@tt.com", password="password123"
+        )
+        self.other_user = User.objects.create_user(
+            email="other@tt.com", password="password123"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.planetarium_dome = PlanetariumDome.objects.create(
+            name="Dome 9", rows=10, seats_in_row=20
+        )
+        self.show_session = ShowSession.objects.create(
+            astronomy_show=AstronomyShow.objects.create(title="Pulsars"),
+            planetarium_dome=self.planetarium_dome,
+            show_time="2024-08-08 15:00",
+        )
+
+    def hold(self, seats, client=None):
+        payload = {
+            "show_session": self.show_session.id,
+            "seats": [{"row": row, "seat": seat} for row, seat in seats],
+        }
+        return (client or self.client).post(
+            SEAT_HOLDS_URL, payload, format="json"
+        )
+
+    def test_held_seats_count_against_tickets_available(self):
+        response = self.hold([(1, 1), (1, 2)])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 2)
+
+        url = reverse(
+            "planetarium:show_session-detail", args=[self.show_session.id]
+        )
+        self.assertEqual(self.client.get(url).data["tickets_available"], 198)
+
+    def test_other_user_cant_hold_or_book_held_seat(self):
+        self.hold([(2, 2)])
+        client = APIClient()
+        client.force_authenticate(user=self.other_user)
+
+        response = self.hold([(2, 2)], client=client)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        payload = {"row": 2, "seat": 2, "show_session": self.show_session.id}
+        response = client.post(TICKETS_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Ticket.objects.exists())
+
+    def test_holder_confirms_hold_into_ticket(self):
+        self.hold([(3, 3)])
+        payload = {"row": 3, "seat": 3, "show_session": self.show_session.id}
+        response = self.client.post(TICKETS_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Ticket.objects.get().reservation.user, self.user)
+        self.assertFalse(SeatHold.objects.exists())
+
+    def after_the_claim_lease(self):
+        later = mock.Mock(time=lambda: time.time() + CLAIM_LEASE + 1)
+        return mock.patch.object(seat_claims, "time", later)
+
+    def test_expired_holds_are_released_in_bulk(self):
+        self.hold([(4, 1), (4, 2)])
+        SeatHold.objects.update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("release_expired_holds", stdout=StringIO())
+        self.assertFalse(SeatHold.objects.exists())
+
+        client = APIClient()
+        client.force_authenticate(user=self.other_user)
+        response = self.hold([(4, 1)], client=client)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_expired_hold_frees_seat_before_the_sweep(self):
+        self.hold([(6, 6)])
+        SeatHold.objects.update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+
+        client = APIClient()
+        client.force_authenticate(user=self.other_user)
+        with self.after_the_claim_lease():
+            response = self.hold([(6, 6)], client=client)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(SeatHold.objects.get().user, self.other_user)
+
+    def test_released_hold_frees_seat(self):
+        hold_id = self.hold([(5, 5)]).data[0]["id"]
+        url = reverse("planetarium:seat_hold-detail", args=[hold_id])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        client = APIClient()
+        client.force_authenticate(user=self.other_user)
+        response = self.hold([(5, 5)], client=client)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_released_hold_keeps_other_claims(self):
+        hold_id = self.hold([(7, 1)]).data[0]["id"]
+        self.assertEqual(claim_seats(self.show_session, [(7, 2)]), [])
+        url = reverse("planetarium:seat_hold-detail", args=[hold_id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(url)
+        self.assertEqual(
+            claim_seats(self.show_session, [(7, 2)]), [(7, 2)]
+        )
+
+    def test_booking_own_held_seat_removes_the_hold(self):
+        hold_seats(self.user, self.show_session, [(8, 1)])
+        book_seats(self.user, self.show_session, [(8, 1), (8, 2)])
+        self.assertFalse(SeatHold.objects.exists())
+
+    @mock.patch.object(
+        seat_claims, "get_seat_claims", side_effect=RedisError
+    )
+    def test_holds_are_kept_without_claims(self, get_seat_claims):
+        with self.assertLogs(seat_claims.logger, "WARNING"):
+            hold_seats(self.user, self.show_session, [(9, 1)])
+            with self.assertRaises(SeatsUnavailable):
+                book_seats(self.other_user, self.show_session, [(9, 1)])
+
+            book_seats(self.user, self.show_session, [(9, 1), (9, 2)])
+            self.assertFalse(SeatHold.objects.exists())
+            with self.assertRaises(SeatsUnavailable):
+                hold_seats(self.other_user, self.show_session, [(9, 2)])
+        self.assertFalse(SeatHold.objects.exists())
@@ -1,12 +1,22 @@
+import base64
+from datetime import timedelta
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
+from planetarium import cache as response_cache
 from planetarium.models import (
     AstronomyShow,
     PlanetariumDome,
+    Reservation,
     ShowSession,
+    Ticket,
 )
 from planetarium.serializers import (
     ShowSessionsListSerializer,
@@ -47,6 +57,253 @@ class ShowSessionsViewSetTests(APITestCase):
             self.assertEqual(res["show_time"], ser["show_time"])
             self.assertEqual(res["tickets_available"], 200)
 
+    def test_show_session_detail_is_modified_by_tickets(self):
+        url = reverse(
+            "planetarium:show_session-detail", args=[self.show_session.id]
+        )
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Ticket.objects.create(
+            row=1,
+            seat=1,
+            show_session=self.show_session,
+            reservation=Reservation.objects.create(user=self.user),
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["tickets_available"], 199)
+
+    def create_sessions(self):
+        for day in (9, 9, 9, 10, 11, 12):
+            ShowSession.objects.create(
+                astronomy_show=self.astronomy_show,
+                planetarium_dome=self.planetarium_dome,
+                show_time=f"2024-08-{day:02d} 15:00+00:00",
+            )
+
+    def test_show_sessions_are_paginated_by_cursor(self):
+        self.create_sessions()
+        expected = list(
+            ShowSession.objects.order_by("-show_time", "-id").values_list(
+                "id", flat=True
+            )
+        )
+        pages = []
+        url = f"{SHOW_SESSIONS_URL}?cursor=&page_size=3"
+        while url:
+            response = self.client.get(url)
+            self.assertNotIn("count", response.data)
+            pages.append([row["id"] for row in response.data["results"]])
+            url = response.data["next"]
+        self.assertEqual(sum(pages, []), expected)
+
+        response = self.client.get(response.data["previous"])
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]], pages[1]
+        )
+
+    def test_show_sessions_are_offset_pages_by_default(self):
+        self.create_sessions()
+        response = self.client.get(SHOW_SESSIONS_URL)
+        self.assertEqual(response.data["count"], 7)
+        self.assertIn("offset=5", response.data["next"])
+
+        response = self.client.get(f"{SHOW_SESSIONS_URL}?limit=2&offset=2")
+        self.assertEqual(response.data["count"], 7)
+        self.assertEqual(len(response.data["results"]), 2)
+
+        response = self.client.get(
+            f"{SHOW_SESSIONS_URL}?limit=2&offset=6&count=false"
+        )
+        self.assertNotIn("count", response.data)
+        self.assertIsNone(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f"{SHOW_SESSIONS_URL}?cursor=abc")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        cursor = base64.urlsafe_b64encode(
+            b'{"v": ["garbage", "x"], "r": 0}'
+        ).decode()
+        response = self.client.get(SHOW_SESSIONS_URL, {"cursor": cursor})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_filter_show_sessions_by_dates_and_dome(self):
+        self.create_sessions()
+        response = self.client.get(
+            SHOW_SESSIONS_URL, {"from": "2024-08-09", "to": "2024-08-10"}
+        )
+        self.assertEqual(len(response.data["results"]), 4)
+
+        response = self.client.get(
+            SHOW_SESSIONS_URL, {"from": "2024-08-12T12:00:00+00:00"}
+        )
+        self.assertEqual(len(response.data["results"]), 1)
+
+        other_dome = PlanetariumDome.objects.create(
+            name="Dome 2", rows=5, seats_in_row=5
+        )
+        response = self.client.get(SHOW_SESSIONS_URL, {"dome": other_dome.id})
+        self.assertEqual(response.data["results"], [])
+
+        response = self.client.get(SHOW_SESSIONS_URL, {"from": "August"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_calendar_counts_sessions_and_seats_per_day(self):
+        self.create_sessions()
+        Ticket.objects.create(
+            row=1,
+            seat=1,
+            show_session=self.show_session,
+            reservation=Reservation.objects.create(user=self.user),
+        )
+        response = self.client.get(
+            reverse("planetarium:show_session-calendar"),
+            {"from": "2024-08-08", "to": "2024-08-10"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            [
+                {
+                    "date": "2024-08-08",
+                    "sessions": 1,
+                    "capacity": 200,
+                    "tickets_available": 199,
+                },
+                {
+                    "date": "2024-08-09",
+                    "sessions": 3,
+                    "capacity": 600,
+                    "tickets_available": 600,
+                },
+                {
+                    "date": "2024-08-10",
+                    "sessions": 1,
+                    "capacity": 200,
+                    "tickets_available": 200,
+                },
+            ],
+        )
+
+    def test_calendar_range_is_limited(self):
+        response = self.client.get(
+            reverse("planetarium:show_session-calendar"),
+            {"from": "2024-01-01", "to": "2025-12-31"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def create_upcoming_sessions(self):
+        other_dome = PlanetariumDome.objects.create(
+            name="Dome 2", rows=5, seats_in_row=5
+        )
+        now = timezone.now()
+        return [
+            ShowSession.objects.create(
+                astronomy_show=self.astronomy_show,
+                planetarium_dome=planetarium_dome,
+                show_time=now + timedelta(hours=hours),
+            )
+            for planetarium_dome, hours in (
+                (self.planetarium_dome, 3),
+                (other_dome, 2),
+                (self.planetarium_dome, 1),
+                (other_dome, 4),
+            )
+        ]
+
+    def test_upcoming_returns_next_sessions(self):
+        sessions = self.create_upcoming_sessions()
+        url = reverse("planetarium:show_session-upcoming")
+
+        response = self.client.get(url, {"limit": 3})
+        self.assertEqual(
+            [session["id"] for session in response.data],
+            [sessions[2].id, sessions[1].id, sessions[0].id],
+        )
+
+        response = self.client.get(url, {"limit": 1, "per": "dome"})
+        self.assertEqual(
+            [session["id"] for session in response.data],
+            [sessions[2].id, sessions[1].id],
+        )
+
+        response = self.client.get(url, {"per": "planet"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upcoming_is_cached_until_the_schedule_changes(self):
+        sessions = self.create_upcoming_sessions()
+        url = reverse("planetarium:show_session-upcoming")
+        self.client.get(url, {"limit": 1})
+
+        ShowSession.objects.filter(id=sessions[0].id).update(
+            show_time=timezone.now() + timedelta(minutes=30)
+        )
+        response = self.client.get(url, {"limit": 1})
+        self.assertEqual(response.data[0]["id"], sessions[2].id)
+
+        sessions[0].refresh_from_db()
+        sessions[0].save()
+        response = self.client.get(url, {"limit": 1})
+        self.assertEqual(response.data[0]["id"], sessions[0].id)
+
+    def test_upcoming_tickets_available_is_cached_for_a_minute(self):
+        self.create_upcoming_sessions()
+        url = reverse("planetarium:show_session-upcoming")
+        with mock.patch.object(
+            response_cache.cache, "set", wraps=response_cache.cache.set
+        ) as cache_set:
+            self.client.get(url, {"limit": 1})
+        timeouts = [
+            timeout
+            for (key, _, timeout), _ in cache_set.call_args_list
+            if key.startswith("cached_response:")
+        ]
+        self.assertEqual(timeouts, [60])
+
+    def test_cache_keys_of_long_urls_stay_short(self):
+        url = reverse("planetarium:show_session-list")
+        with mock.patch.object(
+            response_cache.cache, "set", wraps=response_cache.cache.set
+        ) as cache_set:
+            self.client.get(url, {"search": "y" * 300})
+        keys = [key for (key, *_), _ in cache_set.call_args_list]
+        self.assertTrue(keys)
+        self.assertLess(max(map(len, keys)), 200)
+
+    def test_update_keeps_tickets_sold(self):
+        Ticket.objects.create(
+            row=1,
+            seat=1,
+            show_session=self.show_session,
+            reservation=Reservation.objects.create(user=self.user),
+        )
+        self.user.is_staff = True
+        self.user.save()
+        url = reverse(
+            "planetarium:show_session-detail", args=[self.show_session.id]
+        )
+        payload = {
+            "astronomy_show": self.astronomy_show.id,
+            "planetarium_dome": self.planetarium_dome.id,
+            "show_time": "2024-08-08 18:00",
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(url, payload)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        updates = [
+            query["sql"] for query in queries
+            if query["sql"].startswith('UPDATE "planetarium_showsession"')
+        ]
+        self.assertTrue(updates)
+        self.assertFalse(any("tickets_sold" in sql for sql in updates))
+
+        self.show_session.refresh_from_db()
+        self.assertEqual(self.show_session.tickets_sold, 1)
+
     def test_anonymous_user_cant_create_show_session(self):
         payload = {
             "astronomy_show": self.astronomy_show.id,
@@ -74,3 +331,51 @@ class ShowSessionsViewSetTests(APITestCase):
         )
         self.assertEqual(response.data["show_time"], "2024-08-08, 15:00")
         self.assertEqual(response.data["tickets_available"], 200)
+
+    def test_seat_map_packs_taken_seats_into_bitmap(self):
+        url = reverse(
+            "planetarium:show_session-seat-map", args=[self.show_session.id]
+        )
+        reservation = Reservation.objects.create(user=self.user)
+        Ticket.objects.create(
+            row=1, seat=1,
+            show_session=self.show_session, reservation=reservation
+        )
+        Ticket.objects.create(
+            row=2, seat=20,
+            show_session=self.show_session, reservation=reservation
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["taken"], 2)
+
+        bitmap = base64.b64decode(response.data["bitmap"])
+        self.assertEqual(len(bitmap), 25)
+        self.assertEqual(bitmap[0], 0b10000000)
+        self.assertEqual(bitmap[4], 0b00000001)
+        self.assertEqual(sum(bin(byte).count("1") for byte in bitmap), 2)
+
+    def test_seat_map_is_invalidated_when_ticket_changes(self):
+        url = reverse(
+            "planetarium:show_session-seat-map", args=[self.show_session.id]
+        )
+        self.assertEqual(self.client.get(url).data["taken"], 0)
+
+        reservation = Reservation.objects.create(user=self.user)
+        Ticket.objects.create(
+            row=5, seat=5,
+            show_session=self.show_session, reservation=reservation
+        )
+        self.assertEqual(self.client.get(url).data["taken"], 1)
+
+    def test_show_session_detail_follows_dome_changes(self):
+        url = reverse(
+            "planetarium:show_session-detail", args=[self.show_session.id]
+        )
+        self.client.get(url)
+        self.planetarium_dome.seats_in_row = 30
+        self.planetarium_dome.save()
+
+        response = self.client.get(url)
+        self.assertEqual(response.data["planetarium_dome"]["capacity"], 300)
+        self.assertEqual(response.data["tickets_available"], 300)
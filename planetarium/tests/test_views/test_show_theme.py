@@ -28,6 +28,39 @@ class ShowThemeApiTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response_data["results"], serializer.data)
 
+    def test_show_theme_list_not_modified(self):
+        ShowTheme.objects.create(name="Theme 1")
+        response = self.client.get(SHOW_THEME_URL)
+        self.assertNotIn("Last-Modified", response)
+        # The ETag is kept with the cached response
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                SHOW_THEME_URL, HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_show_theme_list_modified_by_deletion(self):
+        ShowTheme.objects.create(name="Theme 1")
+        theme = ShowTheme.objects.create(name="Theme 2")
+        response = self.client.get(SHOW_THEME_URL)
+        theme.delete()
+        response = self.client.get(
+            SHOW_THEME_URL,
+            HTTP_IF_NONE_MATCH=response["ETag"],
+            HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 1)
+
+    def test_show_theme_list_etag_changes_with_themes(self):
+        theme = ShowTheme.objects.create(name="Theme 1")
+        etag = self.client.get(SHOW_THEME_URL)["ETag"]
+        theme.name = "Theme 2"
+        theme.save()
+        response = self.client.get(SHOW_THEME_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
     def test_admin_create_show_theme(self):
         staff_user = get_user_model().objects.create_user(
             email="staffuser@tt.com", password="password", is_staff=True
@@ -56,3 +89,16 @@ class ShowThemeApiTests(TestCase):
         serializer = ShowThemeSerializer(show_theme)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, serializer.data)
+
+    def test_cached_list_is_invalidated_by_changes(self):
+        show_theme = ShowTheme.objects.create(name="Theme 1")
+        self.client.get(SHOW_THEME_URL)
+
+        show_theme.name = "Renamed Theme"
+        show_theme.save()
+        response = self.client.get(SHOW_THEME_URL)
+        self.assertEqual(response.data["results"][0]["name"], "Renamed Theme")
+
+        show_theme.delete()
+        response = self.client.get(SHOW_THEME_URL)
+        self.assertEqual(response.data["results"], [])
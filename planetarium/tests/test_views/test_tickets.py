@@ -1,13 +1,19 @@
+import uuid
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
+from planetarium.idempotency import _release_lock
+from planetarium.metrics import get_metrics
 from planetarium.models import (
     AstronomyShow,
     PlanetariumDome,
     Reservation,
     ShowSession,
+    ShowTheme,
     Ticket,
 )
 from planetarium.serializers import TicketListSerializer
@@ -67,11 +73,42 @@ class TicketViewSetTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["results"], serializer.data)
 
+    def test_cached_ticket_list_is_per_user(self):
+        self.client.get(TICKETS_URL)
+        other = User.objects.create_user(
+            email="other@tt.com", password="password123"
+        )
+        client = APIClient()
+        client.force_authenticate(user=other)
+        response = client.get(TICKETS_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], [])
+
+    def test_cached_ticket_list_is_refreshed_after_booking(self):
+        self.client.get(TICKETS_URL)
+        payload = {"row": 2, "seat": 2, "show_session": self.show_session.id}
+        self.client.post(TICKETS_URL, payload)
+        response = self.client.get(TICKETS_URL)
+        self.assertEqual(len(response.data["results"]), 2)
+
     def test_get_ticket_detail(self):
         url = reverse("planetarium:ticket-detail", args=[self.ticket.id])
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_ticket_detail_is_modified_by_theme_rename(self):
+        show_theme = ShowTheme.objects.create(name="Galaxies")
+        self.astronomy_show.show_theme = show_theme
+        self.astronomy_show.save()
+        url = reverse("planetarium:ticket-detail", args=[self.ticket.id])
+        etag = self.client.get(url)["ETag"]
+
+        show_theme.name = "Quasars"
+        show_theme.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("Quasars", str(response.data))
+
     def test_ticket_validation(self):
         payload = {"row": 15, "seat": 2, "show_session": self.show_session.id}
         response = self.client.post(TICKETS_URL, payload)
@@ -89,3 +126,87 @@ class TicketViewSetTests(APITestCase):
         serializer = TicketListSerializer(tickets, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["results"], serializer.data)
+
+    def test_retry_with_idempotency_key_is_replayed(self):
+        payload = {"row": 3, "seat": 3, "show_session": self.show_session.id}
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        first = self.client.post(TICKETS_URL, payload, headers=headers)
+        retry = self.client.post(TICKETS_URL, payload, headers=headers)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Reservation.objects.count(), 2)
+        self.assertEqual(Ticket.objects.count(), 2)
+
+    def test_idempotency_lock_of_another_request_is_kept(self):
+        lock_key = f"idempotency:lock:{uuid.uuid4()}"
+        cache.add(lock_key, 1, 30)
+        # The first lock expired and another request took it over
+        cache.set(lock_key, 2, 30)
+        _release_lock(lock_key, 1)
+        self.assertEqual(cache.get(lock_key), 2)
+        _release_lock(lock_key, 2)
+        self.assertIsNone(cache.get(lock_key))
+
+    def test_idempotency_key_reused_with_other_payload(self):
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        self.client.post(
+            TICKETS_URL,
+            {"row": 4, "seat": 4, "show_session": self.show_session.id},
+            headers=headers,
+        )
+        response = self.client.post(
+            TICKETS_URL,
+            {"row": 5, "seat": 5, "show_session": self.show_session.id},
+            headers=headers,
+        )
+        self.assertEqual(
+            response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+        self.assertEqual(Ticket.objects.count(), 2)
+
+    def test_taken_seat_is_reported_as_conflict_with_suggestions(self):
+        payload = {"row": 1, "seat": 1, "show_session": self.show_session.id}
+        response = self.client.post(TICKETS_URL, payload)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["code"], "seats_conflict")
+        self.assertEqual(response.data["conflicts"], [{"row": 1, "seat": 1}])
+        self.assertEqual(
+            response.data["suggestions"], [{"row": 1, "seat": 2}]
+        )
+
+    def test_conflict_on_database_constraint_is_counted(self):
+        self.client.post(
+            TICKETS_URL,
+            {"row": 6, "seat": 1, "show_session": self.show_session.id},
+        )
+        # Created behind the back of the seat claims
+        Ticket.objects.create(
+            row=6, seat=2,
+            show_session=self.show_session, reservation=self.reservation
+        )
+        integrity_conflicts = get_metrics()["booking.integrity_conflicts"]
+
+        response = self.client.post(
+            TICKETS_URL,
+            {"row": 6, "seat": 2, "show_session": self.show_session.id},
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["conflicts"], [{"row": 6, "seat": 2}])
+        self.assertEqual(
+            get_metrics()["booking.integrity_conflicts"],
+            integrity_conflicts + 1,
+        )
+
+    def test_only_staff_can_see_metrics(self):
+        url = reverse("planetarium:metrics")
+        self.assertEqual(
+            self.client.get(url).status_code, status.HTTP_403_FORBIDDEN
+        )
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("booking.claim_conflicts", response.data)
@@ -3,8 +3,10 @@ from rest_framework import routers
 
 from planetarium.views import (
     AstronomyShowViewSet,
+    MetricsView,
     PlanetariumDomeViewSet,
     ReservationViewSet,
+    SeatHoldViewSet,
     ShowSessionsViewSet,
     ShowThemeViewSet,
     TicketViewSet,
@@ -40,7 +42,15 @@ router.register(
     TicketViewSet,
     basename="ticket"
 )
+router.register(
+    "seat_holds",
+    SeatHoldViewSet,
+    basename="seat_hold"
+)
 
-urlpatterns = [path("", include(router.urls))]
+urlpatterns = [
+    path("", include(router.urls)),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+]
 
 app_name = "planetarium"
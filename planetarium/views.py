@@ -1,21 +1,35 @@
-from datetime import datetime
+import math
+from datetime import datetime, time, timedelta
 
-from django.db.models import Count, F
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Window
+from django.db.models.functions import Coalesce, Now, RowNumber, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from django.views.decorators.cache import never_cache
 from drf_spectacular.utils import OpenApiParameter, extend_schema
-from rest_framework import status, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from planetarium.cache import cache_response
+from planetarium.conditional import conditional_response
+from planetarium.db_router import ReplicaReadMixin
+from planetarium.idempotency import idempotent
+from planetarium.metrics import cache_stats, get_metrics
 from planetarium.models import (
     AstronomyShow,
     PlanetariumDome,
     Reservation,
+    SeatHold,
     ShowSession,
     ShowTheme,
     Ticket,
 )
+from planetarium.pagination import KeysetPagination
 from planetarium.permissions import (
     IsAdminOrReadOnly,
     IsAuthorized,
@@ -26,31 +40,114 @@ from planetarium.serializers import (
     AstronomyShowListSerializer,
     AstronomyShowRetrieveSerializer,
     PlanetariumDomeSerializer,
+    ReservationBookingResultSerializer,
+    ReservationBookingSerializer,
     ReservationSerializer,
+    SeatAllocationSerializer,
+    SeatHoldCreateSerializer,
+    SeatHoldSerializer,
+    ShowSessionsCalendarDaySerializer,
     ShowSessionsCreateUpdateSerializer,
     ShowSessionsListSerializer,
     ShowSessionsRetrieveSerializer,
+    ShowSessionsUpcomingSerializer,
     ShowThemeSerializer,
     TicketCreateSerializer,
     TicketListSerializer,
     TicketRetrieveSerializer,
+    TypeaheadSerializer,
 )
-from planetarium.services.telegram_bot import send_telegram_message
-
-
-class ShowThemeViewSet(viewsets.ModelViewSet):
+from planetarium.services.booking import (
+    SeatsUnavailable,
+    book_seats,
+    release_hold,
+)
+from planetarium.services.search import (
+    search_astronomy_shows,
+    search_planetarium_domes,
+)
+from planetarium.services.seat_allocation import allocate_seats
+from planetarium.services.seat_map import get_seat_map
+from planetarium.services.typeahead import (
+    DEFAULT_LIMIT,
+    MAX_LIMIT,
+    typeahead_index,
+)
+from user.authentication import StatelessReadJWTAuthentication
+
+
+SEAT_ALLOCATION_ATTEMPTS = 3
+
+# Days shown by the calendar without a "to" bound, and at most
+CALENDAR_DAYS = 31
+CALENDAR_MAX_DAYS = 366
+
+# Sessions of the upcoming schedule, in total or per dome or theme
+UPCOMING_LIMIT = 5
+UPCOMING_MAX_LIMIT = 50
+UPCOMING_PARTITIONS = {
+    "dome": "planetarium_dome_id",
+    "theme": "astronomy_show__show_theme_id",
+}
+
+# Timestamps of everything a show session or ticket response shows
+SHOW_SESSION_FIELDS = [
+    "updated_at",
+    "astronomy_show__updated_at",
+    "astronomy_show__show_theme__updated_at",
+    "planetarium_dome__updated_at",
+]
+TICKET_FIELDS = [
+    "updated_at",
+    "show_session__updated_at",
+    "show_session__astronomy_show__updated_at",
+    "show_session__astronomy_show__show_theme__updated_at",
+    "show_session__planetarium_dome__updated_at",
+]
+
+SHOW_SESSION_FILTERS = [
+    OpenApiParameter(
+        "from",
+        type=str,
+        description="Sessions from a date or datetime "
+                    "(ex. ?from=2024-08-01)",
+    ),
+    OpenApiParameter(
+        "to",
+        type=str,
+        description="Sessions up to a date, included, or a datetime "
+                    "(ex. ?to=2024-08-31)",
+    ),
+    OpenApiParameter(
+        "dome",
+        type={"type": "list", "items": {"type": "number"}},
+        description="Filter by planetarium dome ids (ex. ?dome=1,2)",
+    ),
+    OpenApiParameter(
+        "theme",
+        type={"type": "list", "items": {"type": "number"}},
+        description="Filter by show theme ids (ex. ?theme=1,2)",
+    ),
+]
+
+
+class ShowThemeViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """Endpoints of the show themes in planetarium with basic CRUD operations"""
 
     queryset = ShowTheme.objects.all()
     serializer_class = ShowThemeSerializer
     permission_classes = [IsAdminOrReadOnly]
 
-    @method_decorator(cache_page(60 * 60 * 5))
+    @cache_response(60 * 60 * 24, resources=["show_themes"])
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    @conditional_response()
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
-class AstronomyShowViewSet(viewsets.ModelViewSet):
+class AstronomyShowViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """Endpoints of the astronomy shows in planetarium with basic CRUD operations"""
 
     permission_classes = [IsAdminOrReadOnly]
@@ -58,6 +155,7 @@ class AstronomyShowViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         queryset = AstronomyShow.objects.select_related("show_theme")
 
+        search = self.request.query_params.get("search")
         title = self.request.query_params.get("title")
         show_theme = self.request.query_params.get("show_theme")
 
@@ -65,6 +163,8 @@ class AstronomyShowViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(title__icontains=title)
         if show_theme:
             queryset = queryset.filter(show_theme__name__icontains=show_theme)
+        if search:
+            queryset = search_astronomy_shows(queryset, search)
         return queryset.distinct()
 
     def get_serializer_class(self):
@@ -76,6 +176,12 @@ class AstronomyShowViewSet(viewsets.ModelViewSet):
 
     @extend_schema(
         parameters=[
+            OpenApiParameter(
+                "search",
+                type=str,
+                description="Search titles and descriptions, best matches "
+                            "first (ex. ?search=black holes)",
+            ),
             OpenApiParameter(
                 "title",
                 type={"type": "list", "items": {"type": "string"}},
@@ -89,12 +195,47 @@ class AstronomyShowViewSet(viewsets.ModelViewSet):
             ),
         ]
     )
-    @method_decorator(cache_page(60 * 60 * 5))
+    @cache_response(
+        60 * 60 * 24, resources=["astronomy_shows", "show_themes"]
+    )
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
+    @conditional_response(fields=["updated_at", "show_theme__updated_at"])
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
-class PlanetariumDomeViewSet(viewsets.ModelViewSet):
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "q",
+                type=str,
+                description="Beginning of a word of the title or theme "
+                            "(ex. ?q=bla)",
+            ),
+            OpenApiParameter(
+                "limit",
+                type=int,
+                description=f"Number of completions, at most {MAX_LIMIT}",
+            ),
+        ],
+        responses=TypeaheadSerializer(many=True),
+    )
+    @action(methods=["GET"], detail=False)
+    def autocomplete(self, request):
+        """Endpoint completing show titles and theme names as they are
+        typed, answered from memory"""
+        try:
+            limit = int(request.query_params.get("limit", DEFAULT_LIMIT))
+        except ValueError:
+            limit = DEFAULT_LIMIT
+        limit = min(max(limit, 1), MAX_LIMIT)
+        return Response(
+            typeahead_index.complete(request.query_params.get("q", ""), limit)
+        )
+
+
+class PlanetariumDomeViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """Endpoints of the planetarium domes description with basic CRUD operations"""
 
     serializer_class = PlanetariumDomeSerializer
@@ -105,26 +246,63 @@ class PlanetariumDomeViewSet(viewsets.ModelViewSet):
         name = self.request.query_params.get("name")
 
         if name:
-            queryset = queryset.filter(name__icontains=name)
+            queryset = search_planetarium_domes(queryset, name)
 
         return queryset.distinct()
 
+    @conditional_response()
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
-class ReservationViewSet(viewsets.ModelViewSet):
+    @conditional_response()
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class ReservationViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """Endpoints of the reservations in planetarium with basic CRUD operations"""
 
     queryset = Reservation.objects.select_related("user")
     serializer_class = ReservationSerializer
     permission_classes = [IsAuthorized]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return Reservation.objects.filter(user=self.request.user)
 
+    @cache_response(
+        60 * 60, resources=["reservations:{user}"], scope="user"
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def get_serializer_class(self):
+        if self.action == "book":
+            return ReservationBookingSerializer
+        return ReservationSerializer
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(methods=["POST"], detail=False)
+    @idempotent
+    def book(self, request):
+        """Endpoint for booking several seats of one show session at once"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        reservation = serializer.save()
+
+        return Response(
+            ReservationBookingResultSerializer(reservation).data,
+            status=status.HTTP_201_CREATED,
+        )
+
 
-class ShowSessionsViewSet(viewsets.ModelViewSet):
+class ShowSessionsViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """Endpoints of the show sessions in planetarium with basic CRUD operations"""
 
     queryset = ShowSession.objects.select_related(
@@ -132,18 +310,245 @@ class ShowSessionsViewSet(viewsets.ModelViewSet):
     ).annotate(
         tickets_available=(
             F("planetarium_dome__rows") * F("planetarium_dome__seats_in_row")
-            - Count("ticket")
+            - F("tickets_sold")
+            - Coalesce(
+                Subquery(
+                    SeatHold.objects.filter(
+                        show_session=OuterRef("pk"), expires_at__gt=Now()
+                    ).values("show_session").annotate(
+                        count=Count("id")
+                    ).values("count")
+                ),
+                0,
+            )
         )
     )
+    # Reads only need an authenticated user, not its row
+    authentication_classes = [StatelessReadJWTAuthentication]
     permission_classes = [IsAuthorizedOrReadOnly]
+    pagination_class = KeysetPagination
+
+    @staticmethod
+    def _parse_bound(name, value, end=False):
+        """Datetime of a from or to param. A date stands for its whole day,
+        so it starts the day, or with end=True starts the next one."""
+        try:
+            day = parse_date(value)
+            moment = None if day else parse_datetime(value)
+        except ValueError:
+            day = moment = None
+        if day is not None:
+            if end:
+                day += timedelta(days=1)
+            return timezone.make_aware(datetime.combine(day, time.min)), True
+        if moment is None:
+            raise ValidationError(
+                {name: "Enter a date or datetime in ISO 8601 format."}
+            )
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment, False
+
+    @staticmethod
+    def _params_to_ints(name, value):
+        try:
+            return [int(str_id) for str_id in value.split(",")]
+        except ValueError:
+            raise ValidationError({name: "Enter comma separated ids."})
+
+    def get_schedule_range(self):
+        """Start and end of the from and to params, and whether the end is
+        excluded. The calendar always covers a bounded range."""
+        start = self.request.query_params.get("from")
+        end = self.request.query_params.get("to")
+        start = self._parse_bound("from", start)[0] if start else None
+        end, end_excluded = (
+            self._parse_bound("to", end, end=True) if end else (None, False)
+        )
+
+        if self.action == "calendar":
+            if start is None:
+                start = timezone.make_aware(
+                    datetime.combine(timezone.localdate(), time.min)
+                )
+            if end is None:
+                end = start + timedelta(days=CALENDAR_DAYS)
+                end_excluded = True
+            if end - start > timedelta(days=CALENDAR_MAX_DAYS):
+                raise ValidationError(
+                    {"to": f"The calendar spans {CALENDAR_MAX_DAYS} days "
+                           "at most."}
+                )
+        return start, end, end_excluded
+
+    def get_queryset(self):
+        queryset = self.queryset
+        if self.action not in ("list", "calendar", "upcoming"):
+            return queryset
+
+        start, end, end_excluded = self.get_schedule_range()
+        dome = self.request.query_params.get("dome")
+        theme = self.request.query_params.get("theme")
+
+        if start:
+            queryset = queryset.filter(show_time__gte=start)
+        if end:
+            lookup = "show_time__lt" if end_excluded else "show_time__lte"
+            queryset = queryset.filter(**{lookup: end})
+        if dome:
+            queryset = queryset.filter(
+                planetarium_dome_id__in=self._params_to_ints("dome", dome)
+            )
+        if theme:
+            queryset = queryset.filter(
+                astronomy_show__show_theme_id__in=self._params_to_ints(
+                    "theme", theme
+                )
+            )
+        return queryset
 
     def get_serializer_class(self):
         if self.action == "list":
             return ShowSessionsListSerializer
+        if self.action == "calendar":
+            return ShowSessionsCalendarDaySerializer
+        if self.action == "upcoming":
+            return ShowSessionsUpcomingSerializer
         if self.action in ("create", "update"):
             return ShowSessionsCreateUpdateSerializer
+        if self.action == "allocate":
+            return SeatAllocationSerializer
         return ShowSessionsRetrieveSerializer
 
+    # tickets_available is not versioned and may lag for up to a minute,
+    # the seat map is the exact source for booking
+    @extend_schema(parameters=SHOW_SESSION_FILTERS)
+    @cache_response(
+        60,
+        resources=[
+            "show_sessions",
+            "astronomy_shows",
+            "show_themes",
+            "planetarium_domes",
+        ],
+        scope="authenticated",
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_response(fields=SHOW_SESSION_FIELDS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @extend_schema(
+        parameters=SHOW_SESSION_FILTERS,
+        responses=ShowSessionsCalendarDaySerializer(many=True),
+    )
+    @action(methods=["GET"], detail=False)
+    @cache_response(
+        60,
+        resources=[
+            "show_sessions",
+            "astronomy_shows",
+            "show_themes",
+            "planetarium_domes",
+        ],
+        scope="authenticated",
+    )
+    def calendar(self, request):
+        """Endpoint with the number of sessions and seats of every day,
+        from today for a month unless from and to are given"""
+        days = (
+            self.get_queryset()
+            .annotate(date=TruncDate("show_time"))
+            .order_by("date")
+            .values("date")
+            .annotate(
+                sessions=Count("id"),
+                capacity=Sum(
+                    F("planetarium_dome__rows")
+                    * F("planetarium_dome__seats_in_row")
+                ),
+                available=Sum("tickets_available"),
+            )
+        )
+        return Response(self.get_serializer(days, many=True).data)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                "limit",
+                type=int,
+                description=f"Number of sessions, in total or per dome or "
+                            f"theme, at most {UPCOMING_MAX_LIMIT}",
+            ),
+            OpenApiParameter(
+                "per",
+                type=str,
+                enum=[*UPCOMING_PARTITIONS],
+                description="Next sessions of every dome or every theme "
+                            "(ex. ?per=dome)",
+            ),
+            *SHOW_SESSION_FILTERS,
+        ],
+    )
+    @action(methods=["GET"], detail=False)
+    # tickets_available is not versioned, like in the list
+    @cache_response(
+        60,
+        resources=[
+            "show_sessions",
+            "astronomy_shows",
+            "show_themes",
+            "planetarium_domes",
+        ],
+        scope="authenticated",
+    )
+    def upcoming(self, request):
+        """Endpoint with the next sessions of the schedule, optionally the
+        next ones of every dome or theme.
+
+        The response is cached for a minute at most, until its first
+        session starts or the schedule changes.
+        """
+        try:
+            limit = int(request.query_params.get("limit", UPCOMING_LIMIT))
+        except ValueError:
+            limit = UPCOMING_LIMIT
+        limit = min(max(limit, 1), UPCOMING_MAX_LIMIT)
+        per = request.query_params.get("per")
+        if per is not None and per not in UPCOMING_PARTITIONS:
+            raise ValidationError(
+                {"per": f"Choose one of {', '.join(UPCOMING_PARTITIONS)}."}
+            )
+
+        now = timezone.now()
+        queryset = self.get_queryset().filter(show_time__gte=now)
+        if per is None:
+            sessions = queryset.order_by("show_time", "id")[:limit]
+        else:
+            partition = UPCOMING_PARTITIONS[per]
+            sessions = (
+                queryset.annotate(
+                    position=Window(
+                        RowNumber(),
+                        partition_by=F(partition),
+                        order_by=[F("show_time").asc(), F("id").asc()],
+                    )
+                )
+                .filter(position__lte=limit)
+                .order_by(partition, "show_time", "id")
+            )
+        sessions = list(sessions)
+
+        response = Response(self.get_serializer(sessions, many=True).data)
+        if sessions:
+            first_start = min(session.show_time for session in sessions)
+            response.cache_timeout = max(
+                math.ceil((first_start - now).total_seconds()), 1
+            )
+        return response
+
     @action(
         methods=["GET"],
         detail=False,
@@ -151,7 +556,7 @@ class ShowSessionsViewSet(viewsets.ModelViewSet):
     )
     def nearest_show(self, request):
         """Endpoint for searching nearest show in schedule"""
-        now = datetime.now()
+        now = timezone.now()
         nearest_session = (
             self.queryset.filter(
                 show_time__gte=now
@@ -167,11 +572,62 @@ class ShowSessionsViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+    @method_decorator(never_cache)
+    @action(methods=["GET"], detail=True)
+    def seat_map(self, request, pk=None):
+        """Endpoint with occupied seats of the session packed into a bitmap.
+
+        Seats are laid out row by row, one bit per seat starting from the
+        most significant bit, and the bitmap is base64 encoded.
+        """
+        show_session = self.get_object()
+        return Response(get_seat_map(show_session))
+
+    @action(
+        methods=["POST"],
+        detail=True,
+        permission_classes=[IsAuthorized],
+    )
+    @idempotent
+    def allocate(self, request, pk=None):
+        """Endpoint for booking the best block of adjacent seats for a party.
+
+        The block is taken from one row, as close to the middle of the dome
+        as possible.
+        """
+        show_session = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        party_size = serializer.validated_data["party_size"]
+
+        seat_map = get_seat_map(show_session)
+        unavailable = set()
+        for _ in range(SEAT_ALLOCATION_ATTEMPTS):
+            seats = allocate_seats(seat_map, party_size, exclude=unavailable)
+            if seats is None:
+                break
+            try:
+                reservation, _ = book_seats(request.user, show_session, seats)
+            except SeatsUnavailable as error:
+                unavailable.update(error.seats)
+                continue
+
+            return Response(
+                ReservationBookingResultSerializer(reservation).data,
+                status=status.HTTP_201_CREATED,
+            )
+
+        return Response(
+            {"detail": f"No {party_size} adjacent seats are available."},
+            status=status.HTTP_409_CONFLICT,
+        )
+
 
-class TicketViewSet(viewsets.ModelViewSet):
+class TicketViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """Endpoints of the tickets in planetarium with basic CRUD operations"""
 
     permission_classes = [IsAuthorized]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -199,15 +655,72 @@ class TicketViewSet(viewsets.ModelViewSet):
             return TicketCreateSerializer
         return TicketRetrieveSerializer
 
+    @cache_response(
+        60 * 60,
+        resources=[
+            "reservations:{user}",
+            "show_sessions",
+            "astronomy_shows",
+            "planetarium_domes",
+        ],
+        scope="user",
+    )
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_response(fields=TICKET_FIELDS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @idempotent
     def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
-        if response.status_code == status.HTTP_201_CREATED:
-            ticket = Ticket.objects.get(id=response.data["id"])
-            message = (
-                f"New ticket created by {ticket.reservation.user.email}\n"
-                f"Event: {ticket.show_session.astronomy_show.title}\n"
-                f"Row: {ticket.row}, Seat: {ticket.seat}\n"
-                f"Time: {ticket.show_session.show_time}"
-            )
-            send_telegram_message(message)
-        return response
+        return super().create(request, *args, **kwargs)
+
+
+class SeatHoldViewSet(
+    ReplicaReadMixin,
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """Endpoints for holding seats while the booking is being completed.
+
+    Held seats are booked by creating tickets for them as usual, expired
+    holds are removed by the release_expired_holds command.
+    """
+
+    permission_classes = [IsAuthorized]
+
+    def get_queryset(self):
+        return SeatHold.objects.filter(
+            user=self.request.user, expires_at__gt=Now()
+        )
+
+    def get_serializer_class(self):
+        if self.action == "create":
+            return SeatHoldCreateSerializer
+        return SeatHoldSerializer
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        holds = serializer.save()
+        return Response(
+            SeatHoldSerializer(holds, many=True).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    def perform_destroy(self, instance):
+        release_hold(instance)
+
+
+class MetricsView(ReplicaReadMixin, APIView):
+    """Counters of booking contention and cache statistics of the worker,
+    for staff only"""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({**get_metrics(), **cache_stats()})
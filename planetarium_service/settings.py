@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework.authtoken",
     "rest_framework_simplejwt",
@@ -57,9 +58,7 @@ MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
-    "django.middleware.cache.UpdateCacheMiddleware",
     "django.middleware.common.CommonMiddleware",
-    "django.middleware.cache.FetchFromCacheMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
@@ -100,6 +99,31 @@ DATABASES = {
     }
 }
 
+# Read replicas of the primary as comma separated host[:port], e.g.
+# POSTGRES_REPLICA_HOSTS=replica1,replica2:5433
+DATABASE_REPLICAS = []
+for number, address in enumerate(
+    filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",")), 1
+):
+    host, _, port = address.strip().partition(":")
+    alias = f"replica_{number}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        # Kept open across requests, reads must not pay for a connection
+        "CONN_MAX_AGE": int(os.getenv("REPLICA_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["planetarium.db_router.ReplicaRouter"]
+
+# Users read from the primary for this long after a write, until the
+# replicas have caught up with it
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", 10))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -141,13 +165,16 @@ STATIC_URL = "static/"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication"
+        "user.authentication.CachedJWTAuthentication"
     ],
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
+    "DEFAULT_PAGINATION_CLASS": "planetarium.pagination.LimitOffsetPagination",
     "PAGE_SIZE": 5,
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
+# Largest page a client may ask for with ?limit= or ?page_size=
+MAX_PAGE_SIZE = 100
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 SIMPLE_JWT = {
@@ -180,12 +207,52 @@ SPECTACULAR_SETTINGS = {
 }
 
 
+SEAT_HOLD_TIMEOUT = timedelta(
+    minutes=int(os.getenv("SEAT_HOLD_MINUTES", 10))
+)
+
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+# Connect and read timeouts of the Bot API requests, in seconds
+TELEGRAM_TIMEOUT = (3.05, 10)
+
+NOTIFICATIONS = {
+    # "single" sends every booking, "digest" one message per show session
+    # and flush interval
+    "MODE": os.getenv("NOTIFICATIONS_MODE", "single"),
+    "FLUSH_INTERVAL": timedelta(seconds=60),
+    # A digest is sent early once it collects this many tickets
+    "FLUSH_SIZE": 50,
+    # Single mode switches to digests while more messages are due
+    "BACKLOG_LIMIT": 200,
+    "BATCH_SIZE": 100,
+    # A worker sends the batch it claimed within this time, or the rest of
+    # the batch becomes due again for other workers
+    "LEASE_TIMEOUT": timedelta(minutes=30),
+    "MAX_ATTEMPTS": 8,
+    "RETRY_BACKOFF": timedelta(seconds=5),
+    "MAX_RETRY_BACKOFF": timedelta(minutes=30),
+}
 
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "BACKEND": "planetarium.cache_backends.ResilientRedisCache",
         "LOCATION": "redis://redis:6379/1",
-    }
+        "OPTIONS": {
+            "socket_connect_timeout": 0.1,
+            "socket_timeout": 0.25,
+            "FAILURE_THRESHOLD": 3,
+            "RESET_TIMEOUT": 10,
+        },
+    },
+    # Versioned responses and serialized fragments, read on almost every
+    # request and rarely written, are kept in each worker too
+    "catalog": {
+        "BACKEND": "planetarium.cache_backends.TwoTierCache",
+        "LOCATION": "default",
+        "OPTIONS": {
+            "MAX_ENTRIES": 1000,
+            "LOCAL_TIMEOUT": 60,
+        },
+    },
 }
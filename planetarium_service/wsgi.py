@@ -10,7 +10,19 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError, connections
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "planetarium.settings")
 
 application = get_wsgi_application()
+
+from planetarium.services.typeahead import typeahead_index  # noqa: E402
+
+try:
+    typeahead_index.load()
+except DatabaseError:
+    # Loaded on the first autocomplete request instead
+    pass
+finally:
+    # Workers forked from this process must not share its connection
+    connections.close_all()
@@ -0,0 +1,104 @@
+"""JWT authentication without a database query per request.
+
+The user is loaded once per USER_CACHE_TIMEOUT and kept in the cache, the
+User signals drop the cached copy on every change, so deactivation, staff
+flips and password changes apply to the next request.
+
+Only USER_CACHE_FIELDS and a hash of the password hash, the one the tokens
+carry, are cached. The other fields of the user are deferred and loaded
+from the database if a view reads them.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import (
+    JWTAuthentication,
+    JWTStatelessUserAuthentication,
+)
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+USER_CACHE_KEY = "auth_user:{user_id}"
+USER_CACHE_TIMEOUT = 60 * 5
+USER_CACHE_FIELDS = ("id", "email", "is_active", "is_staff")
+
+
+def invalidate_user(user_id):
+    """Drop the cached user now and once more when the transaction
+    commits, so a copy loaded in between does not survive"""
+    key = USER_CACHE_KEY.format(user_id=user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def _partial_user(fields):
+    """User with the given field values and the other fields deferred"""
+    model = get_user_model()
+    # from_db takes the values in the order of the model fields
+    names = [
+        field.attname
+        for field in model._meta.concrete_fields
+        if field.attname in fields
+    ]
+    return model.from_db(
+        DEFAULT_DB_ALIAS, names, [fields[name] for name in names]
+    )
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication taking the user from the cache"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            )
+
+        key = USER_CACHE_KEY.format(user_id=user_id)
+        cached = cache.get(key)
+        if cached is None:
+            # Checks the user is active, only active users are cached
+            user = super().get_user(validated_token)
+            cached = {
+                "fields": {
+                    name: getattr(user, name) for name in USER_CACHE_FIELDS
+                },
+                "password_hash": get_md5_hash_password(user.password),
+            }
+            cache.set(key, cached, USER_CACHE_TIMEOUT)
+            return user
+
+        if (
+            api_settings.CHECK_REVOKE_TOKEN
+            and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM)
+            != cached["password_hash"]
+        ):
+            raise AuthenticationFailed(
+                _("The user's password has been changed."),
+                code="password_changed",
+            )
+        return _partial_user(cached["fields"])
+
+
+class StatelessReadJWTAuthentication(CachedJWTAuthentication):
+    """Reads are authenticated by the token alone, as a TokenUser.
+
+    Only for endpoints whose reads need nothing but an authenticated user:
+    a deactivated user keeps reading until the token expires, and the
+    TokenUser is not staff.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.stateless = JWTStatelessUserAuthentication()
+
+    def authenticate(self, request):
+        if request.method in SAFE_METHODS:
+            return self.stateless.authenticate(request)
+        return super().authenticate(request)
@@ -1,3 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from user.authentication import (
+    USER_CACHE_KEY,
+    CachedJWTAuthentication,
+    StatelessReadJWTAuthentication,
+)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@tt.com", password="password123"
+        )
+        cache.delete(USER_CACHE_KEY.format(user_id=self.user.pk))
+        self.factory = APIRequestFactory()
+        self.headers = {
+            "HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"
+        }
+
+    def authenticate(self, authentication, method="get"):
+        request = getattr(self.factory, method)("/", **self.headers)
+        user, _ = authentication.authenticate(request)
+        return user
+
+    def test_user_is_loaded_once(self):
+        authentication = CachedJWTAuthentication()
+        self.authenticate(authentication)
+        with self.assertNumQueries(0):
+            user = self.authenticate(authentication)
+        self.assertEqual(user, self.user)
+
+    def test_cache_keeps_no_password_hash(self):
+        authentication = CachedJWTAuthentication()
+        self.authenticate(authentication)
+        cached = cache.get(USER_CACHE_KEY.format(user_id=self.user.pk))
+        self.assertNotIn(self.user.password, str(cached))
+
+        user = self.authenticate(authentication)
+        self.assertEqual(user.email, self.user.email)
+        user.save()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("password123"))
+
+    def test_deactivated_user_is_rejected(self):
+        authentication = CachedJWTAuthentication()
+        self.authenticate(authentication)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(authentication)
+
+    def test_staff_flip_applies_to_next_request(self):
+        authentication = CachedJWTAuthentication()
+        self.authenticate(authentication)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertTrue(self.authenticate(authentication).is_staff)
+
+    def test_reads_are_stateless(self):
+        authentication = StatelessReadJWTAuthentication()
+        with self.assertNumQueries(0):
+            user = self.authenticate(authentication)
+        self.assertIsInstance(user, TokenUser)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(
+            self.authenticate(authentication, method="post"), self.user
+        )